@@ -0,0 +1,133 @@
+"""
+Microbenchmarks of API collection serialization.
+
+Compares `to_collection_dict` + `jsonify` (ORM objects and dictionaries) with
+`collection_json` (column tuples formatted by compiled serializers) for every
+installed encoder backend.
+
+Usage: python benchmarks/bench_serializers.py [--posts N] [--limit N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+
+from flaskr import create_app, serializers
+from flaskr.db import db, init_db
+from flaskr.models import Post, User
+from flaskr.pagination import keyset_page
+
+
+def fill_database(posts, users=100):
+    """Insert `users` users and `posts` posts with Core bulk inserts."""
+    start = datetime(2020, 1, 1)
+    db.session.execute(User.__table__.insert(), [
+        {
+            'username': 'user{}'.format(i),
+            'password_hash': 'x',
+            'first_name': 'First{}'.format(i),
+            'last_name': 'Last{}'.format(i),
+            'post_count': 0,
+            'updated': start,
+        } for i in range(users)
+    ])
+    db.session.execute(Post.__table__.insert(), [
+        {
+            'author_id': i % users + 1,
+            'created': start + timedelta(seconds=i),
+            'updated': start + timedelta(seconds=i),
+            'title': 'Post number {}'.format(i),
+            'body': 'Lorem ipsum dolor sit amet, "consectetur" adipiscing elit. ' * 5,
+        } for i in range(posts)
+    ])
+    db.session.commit()
+
+
+def orm_posts(limit):
+    page = Post.get_page(limit)
+    return jsonify(Post.to_collection_dict(page, 'api.get_all_posts')).get_data()
+
+
+def row_posts(limit):
+    page = keyset_page(
+        serializers.post_rows(),
+        (Post.created, Post.id_),
+        limit,
+        descending=True,
+    )
+    serializer = serializers.get_serializer('post')
+    return serializers.collection_json('posts', page, serializer, 'api.get_all_posts')
+
+
+def orm_users(limit):
+    page = User.get_page(limit)
+    return jsonify(User.to_collection_dict(page, 'api.get_all_users')).get_data()
+
+
+def row_users(limit):
+    page = keyset_page(serializers.user_rows(), (User.id_,), limit)
+    serializer = serializers.get_serializer('user')
+    return serializers.collection_json('users', page, serializer, 'api.get_all_users')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.sqlite')
+    app = create_app({
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'MAX_PAGE_SIZE': args.limit,
+    })
+    try:
+        with app.app_context():
+            init_db()
+            fill_database(args.posts)
+
+        backends = [name for name in ('json', 'orjson') if _installed(name)]
+        cases = [
+            ('to_collection_dict posts', orm_posts),
+            ('to_collection_dict users', orm_users),
+        ]
+        for backend in backends:
+            label = 'collection_json {} [' + backend + ']'
+            cases.append((label.format('posts'), row_posts, backend))
+            cases.append((label.format('users'), row_users, backend))
+
+        print('{} posts, page of {}, best of {} runs'.format(
+            args.posts, args.limit, args.repeat,
+        ))
+        for name, func, *backend in cases:
+            if backend:
+                app.config['JSON_ENCODER'] = backend[0]
+                serializers.init_app(app)
+            with app.test_request_context('/'):
+                # every run starts with an empty identity map, like a request
+                timer = timeit.Timer(lambda: func(args.limit), setup=db.session.remove)
+                best = min(timer.repeat(repeat=args.repeat, number=1))
+            print('{:<36} {:>9.3f} ms'.format(name, best * 1000))
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+def _installed(backend):
+    try:
+        serializers.get_backend(backend)
+    except ValueError:
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Benchmark suite of models, serializers and endpoints at several data scales.
+
+Every scale is a SQLite database filled by `flaskr.seed` with a fixed seed.
+Each case is run `--repeat` times and its best and median times are
+reported; `--output` saves them as JSON and `--compare` checks them against
+a saved baseline, exiting with status 1 if a case got slower by more than
+`--threshold`.
+
+Usage: python benchmarks/bench_suite.py [--scales small,medium] [--repeat N]
+    [--output results.json] [--compare baseline.json] [--threshold 0.2]
+    [--data-dir DIR]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+from flaskr import create_app
+from flaskr.db import db, init_db
+from flaskr.models import Post, User
+from flaskr.seed import seed_database
+
+# Number of (users, posts) of every scale
+SCALES = {
+    'small': (100, 1000),
+    'medium': (10000, 100000),
+    'large': (10000, 1000000),
+}
+PASSWORD = 'benchmark'
+SEED = 42
+PAGE_SIZE = 20
+
+
+def make_app(db_path):
+    return create_app({
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        # Measure rendering, not the fragment cache
+        'FRAGMENT_CACHE_TYPE': 'null',
+        'METRICS_ENABLED': False,
+        # Cases repeat logins far beyond the default limits
+        'RATELIMIT_ENABLED': False,
+        'SLOW_QUERY_TIME': 0,
+        'SERVER_TIMING': True,
+    })
+
+
+def prepare_database(scale, data_dir):
+    """Build the database of `scale` unless `data_dir` already has it."""
+    users, posts = SCALES[scale]
+    db_path = os.path.join(data_dir, 'bench_{}_{}.sqlite'.format(scale, SEED))
+    if os.path.exists(db_path):
+        return db_path
+    tmp_path = db_path + '.tmp'
+    app = make_app(tmp_path)
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        progress = seed_database(
+            users,
+            posts,
+            seed=SEED,
+            password_hash=generate_password_hash(PASSWORD),
+        )
+        for _ in progress:
+            pass
+        db.session.remove()
+        db.engine.dispose()
+    os.replace(tmp_path, db_path)
+    print('built {} dataset ({} users, {} posts) in {:.1f}s'.format(
+        scale, users, posts, time.perf_counter() - started,
+    ), file=sys.stderr)
+    return db_path
+
+
+def run_cases(app, repeat):
+    """
+    Time every case.
+
+    :return: a dictionary mapping case name to best and median milliseconds.
+    """
+    client = app.test_client()
+    with app.app_context():
+        token = User.query.get(1).get_api_token()
+        db.session.commit()
+    token_header = {'Authorization': 'Bearer {}'.format(token)}
+    login_data = {'username': 'user1', 'password': PASSWORD}
+    token_cache = app.extensions['token_cache']
+    password_cache = app.extensions['password_hasher'].verified
+
+    def in_request(func):
+        def run():
+            with app.test_request_context('/'):
+                func()
+                db.session.remove()
+        return run
+
+    def check(response):
+        assert response.status_code in (200, 302), response.status
+        return response
+
+    cases = {
+        'post_to_collection_dict': in_request(lambda: Post.to_collection_dict(
+            Post.get_page(PAGE_SIZE), 'api.get_all_posts',
+        )),
+        'user_to_collection_dict': in_request(lambda: User.to_collection_dict(
+            User.get_page(PAGE_SIZE), 'api.get_all_users',
+        )),
+        'blog_index': lambda: check(client.get('/')),
+        'api_get_all_posts': lambda: check(
+            client.get('/api/posts', headers=token_header),
+        ),
+        'token_verification_cold': lambda: (
+            token_cache.clear(),
+            check(client.get('/api/users/1', headers=token_header)),
+        ),
+        'token_verification_warm': lambda: check(
+            client.get('/api/users/1', headers=token_header),
+        ),
+        'login': lambda: (
+            password_cache.clear(),
+            check(client.post('/auth/login', data=login_data)),
+        ),
+    }
+    results = {}
+    for name, case in cases.items():
+        case()  # warm up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            case()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            'best_ms': round(min(timings), 4),
+            'median_ms': round(statistics.median(timings), 4),
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare median times of cases present in both result sets.
+
+    :return: a list of (scale, case, baseline ms, current ms, ratio,
+    regressed) tuples.
+    """
+    rows = []
+    for scale, cases in results['results'].items():
+        for case, timing in cases.items():
+            base = baseline['results'].get(scale, {}).get(case)
+            if base is None:
+                continue
+            ratio = timing['median_ms'] / base['median_ms']
+            rows.append((
+                scale, case, base['median_ms'], timing['median_ms'], ratio,
+                ratio > 1 + threshold,
+            ))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', default='small', help=', '.join(SCALES))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare with')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='relative slowdown of median time reported as a regression',
+    )
+    parser.add_argument(
+        '--data-dir',
+        help='keep datasets in this directory and reuse them on later runs',
+    )
+    args = parser.parse_args()
+    scales = args.scales.split(',')
+    unknown = set(scales) - set(SCALES)
+    if unknown:
+        parser.error('unknown scales: {}'.format(', '.join(sorted(unknown))))
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='flaskr_bench_')
+    os.makedirs(data_dir, exist_ok=True)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'repeat': args.repeat,
+            'seed': SEED,
+        },
+        'results': {},
+    }
+    try:
+        for scale in scales:
+            app = make_app(prepare_database(scale, data_dir))
+            results['results'][scale] = run_cases(app, args.repeat)
+            with app.app_context():
+                db.engine.dispose()
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir)
+
+    for scale, cases in results['results'].items():
+        print('{} ({} users, {} posts), {} runs'.format(
+            scale, *SCALES[scale], args.repeat,
+        ))
+        for case, timing in cases.items():
+            print('  {:<28} best {:>9.3f} ms  median {:>9.3f} ms'.format(
+                case, timing['best_ms'], timing['median_ms'],
+            ))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        rows = compare(results, baseline, args.threshold)
+        print('\ncompared with {} (threshold +{:.0%})'.format(
+            args.compare, args.threshold,
+        ))
+        for scale, case, base, current, ratio, regressed in rows:
+            print('  {:<7} {:<28} {:>9.3f} -> {:>9.3f} ms  x{:.2f}{}'.format(
+                scale, case, base, current, ratio, '  REGRESSION' if regressed else '',
+            ))
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 
 from dotenv import load_dotenv
@@ -12,3 +13,116 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
+    # Connection pool of every worker process, not used with SQLite.
+    # Connections are recycled before MySQL's wait_timeout closes them and
+    # pinged on checkout, so a stale connection is replaced instead of failing
+    # the request.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true')
+    # Comma-separated replica URLs read-only views query round robin, and
+    # seconds a user who committed something keeps reading from the primary
+    REPLICA_DATABASE_URIS = [
+        uri.strip() for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+        if uri.strip()
+    ]
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+    # Browser users' last write time is kept in the session, API users' one
+    # in this directory shared by the workers of a host
+    REPLICA_WRITERS_DIR = os.getenv(
+        'REPLICA_WRITERS_DIR',
+        os.path.join(basedir, 'cache', 'writers'),
+    )
+    # Queries running at least this many seconds are logged, 0 disables the log
+    SLOW_QUERY_TIME = float(os.getenv('SLOW_QUERY_TIME', '0.5'))
+    # Report number of queries and DB time of a request in Server-Timing header.
+    # Off by default, since it tells clients how long the database takes
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() in ('1', 'true')
+    # Serve Prometheus metrics at /metrics. With several worker processes set
+    # prometheus_multiproc_dir environment variable to a shared directory
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true')
+    # Log records go through a queue to a background thread writing LOG_FILE
+    # ('-' for stderr), rotated at LOG_MAX_BYTES. LOG_FORMAT is 'text' or
+    # 'json'; records beyond LOG_QUEUE_SIZE waiting to be written are dropped
+    LOG_FILE = os.getenv('LOG_FILE', os.path.join('logs', 'flaskr.log'))
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '10'))
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+    # Keyset pagination: default and maximum number of items on a page
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', '20'))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '100'))
+    # Number of posts on a page of the blog index
+    POSTS_PER_PAGE = int(os.getenv('POSTS_PER_PAGE', '10'))
+    # In-process cache of verified API tokens, size 0 disables it. Workers
+    # keep accepting a token revoked elsewhere for reads for up to the TTL,
+    # writes always check the token in the database
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '1024'))
+    TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '60'))
+    # Number of threads of a worker allowed to run password KDF at once and
+    # seconds the others wait for a free slot before getting 503
+    PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', '2'))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '5'))
+    # Short-lived cache of successful password checks, size 0 disables it
+    PASSWORD_CACHE_SIZE = int(os.getenv('PASSWORD_CACHE_SIZE', '1024'))
+    PASSWORD_CACHE_TTL = float(os.getenv('PASSWORD_CACHE_TTL', '300'))
+    # Cache of the rendered blog post list served to anonymous visitors:
+    # 'simple' keeps it in the worker's memory, 'filesystem' shares it between
+    # workers through FRAGMENT_CACHE_DIR, 'null' disables it. A write clears
+    # the 'simple' cache of its own worker only, the other workers serve their
+    # old copy until it expires, so its TTL defaults to a few seconds
+    FRAGMENT_CACHE_TYPE = os.getenv('FRAGMENT_CACHE_TYPE', 'simple')
+    FRAGMENT_CACHE_DIR = os.getenv(
+        'FRAGMENT_CACHE_DIR',
+        os.path.join(basedir, 'cache', 'fragments'),
+    )
+    FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '500'))
+    FRAGMENT_CACHE_TTL = float(os.getenv(
+        'FRAGMENT_CACHE_TTL',
+        '5' if FRAGMENT_CACHE_TYPE == 'simple' else '300',
+    ))
+    # Number of rows fetched from the database at once by streamed API responses
+    STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '1000'))
+    # Maximum number of posts created by one POST /api/posts/batch request
+    API_BATCH_MAX = int(os.getenv('API_BATCH_MAX', '100'))
+    # JSON encoder of API collections: 'json', 'orjson' or 'auto' to use orjson
+    # if it's installed
+    JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+    # Compression of responses at least COMPRESS_MIN_SIZE bytes long with one of
+    # COMPRESS_MIMETYPES; brotli is used only if the brotli package is installed
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() in ('1', 'true')
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+    COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', '4'))
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+    COMPRESS_MIMETYPES = (
+        'application/json',
+        'application/javascript',
+        'text/css',
+        'text/html',
+        'text/plain',
+        'image/svg+xml',
+    )
+    # Static files precompressed by `flask compress-static`
+    COMPRESS_STATIC_EXTENSIONS = ('.css', '.js', '.html', '.svg', '.json', '.txt')
+    # Token bucket limits of expensive endpoints, see flaskr/ratelimit.py.
+    # 'memory' counts in every worker separately, 'sqlite' shares the counts
+    # between workers of a host through RATELIMIT_SQLITE_PATH
+    RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true')
+    RATELIMIT_STORAGE = os.getenv('RATELIMIT_STORAGE', 'memory')
+    RATELIMIT_SQLITE_PATH = os.getenv(
+        'RATELIMIT_SQLITE_PATH',
+        os.path.join(basedir, 'cache', 'ratelimit.sqlite'),
+    )
+    # Number of reverse proxies in front of the app whose X-Forwarded-For
+    # header is trusted for the client IP, 0 uses the connection's address
+    RATELIMIT_TRUST_PROXY = int(os.getenv('RATELIMIT_TRUST_PROXY', '0'))
+    # JSON object mapping endpoint, optionally prefixed with a method, to a list
+    # of '<requests>/<second|minute|hour|day> per <ip|username|username_ip|token>'
+    RATELIMIT_RULES = json.loads(os.getenv('RATELIMIT_RULES', '{}')) or {
+        'api.get_token': ['20/minute per ip', '5/minute per username_ip'],
+        'api.create_user': ['10/hour per ip'],
+        'POST auth.login': ['20/minute per ip', '5/minute per username_ip'],
+    }
@@ -1,12 +1,17 @@
-import logging
-import os
-from logging.handlers import RotatingFileHandler
-
 from flask import Flask
 from flask_migrate import Migrate
 
 from config import Config
-from flaskr.errors import forbidden_error, internal_server_error, page_not_found_error
+from flaskr.cache import TTLCache, create_fragment_cache
+from flaskr.errors import (
+    forbidden_error,
+    internal_server_error,
+    page_not_found_error,
+    service_unavailable_error,
+    too_many_requests_error,
+)
+from flaskr.pool import engine_options
+from flaskr.security import PasswordHasher
 
 
 def create_app(test_config=None):
@@ -14,40 +19,69 @@ def create_app(test_config=None):
     app.register_error_handler(403, forbidden_error)
     app.register_error_handler(404, page_not_found_error)
     app.register_error_handler(500, internal_server_error)
+    app.register_error_handler(429, too_many_requests_error)
+    app.register_error_handler(503, service_unavailable_error)
 
     app.config.from_object(Config)
 
     if test_config is not None:
         app.config.from_mapping(test_config)
+    # Explicitly set engine options take precedence over `DB_POOL_*` values
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        engine_options(app.config),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    )
+
+    app.extensions['token_cache'] = TTLCache(
+        maxsize=app.config['TOKEN_CACHE_SIZE'],
+        ttl=app.config['TOKEN_CACHE_TTL'],
+    )
+    app.extensions['fragment_cache'] = create_fragment_cache(app.config)
+    app.extensions['password_hasher'] = PasswordHasher(
+        max_concurrency=app.config['PASSWORD_HASH_CONCURRENCY'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+        cache_size=app.config['PASSWORD_CACHE_SIZE'],
+        cache_ttl=app.config['PASSWORD_CACHE_TTL'],
+    )
 
-    from flaskr.db import db, init_db_command
+    from flaskr.db import (
+        db,
+        export_cli,
+        import_cli,
+        init_db_command,
+        init_instrumentation,
+        init_replicas,
+        rebuild_post_counts_command,
+        seed_command,
+    )
 
+    init_replicas(app)
     db.init_app(app)
+    init_instrumentation(app)
     migrate = Migrate(app, db)
     from flaskr import auth
+    app.app_ctx_globals_class = auth.LazyUserGlobals
     app.register_blueprint(auth.bp)
     from flaskr import blog
     from flaskr import models
+    from flaskr import compression
+    from flaskr import log
+    from flaskr import metrics
+    from flaskr import ratelimit
+    from flaskr import serializers
+    compression.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)
+    serializers.init_app(app)
     app.register_blueprint(blog.bp)
     from flaskr.api import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
     app.add_url_rule('/', endpoint='index')
     app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_post_counts_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(import_cli)
+    app.cli.add_command(export_cli)
 
-    if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler(
-            filename='logs/flaskr.log',
-            maxBytes=10240,
-            backupCount=10,
-        )
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.DEBUG)
-        app.logger.addHandler(file_handler)
-
-        app.logger.setLevel(logging.DEBUG)
-        app.logger.info('Flaskr startup')
+    log.init_app(app)
     return app
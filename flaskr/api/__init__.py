@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api_bp = Blueprint('api', __name__)
 
-from flaskr.api import errors, tokens, users, posts
+from flaskr.api import errors, tokens, users, posts, search
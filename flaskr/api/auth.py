@@ -32,9 +32,21 @@ def basic_auth_error():
     return error_response(401)
 
 
+# Requests which don't change anything may be authenticated by the token cache
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
 @token_auth.verify_token
 def verify_token(token):
-    g.current_user = User.check_api_token(token) if token else None
+    """
+    Check user's API token.
+
+    Writes always check the token against the database, so a token revoked
+    through another worker process can't change anything even while that
+    worker's token cache still holds it.
+    """
+    use_cache = request.method in SAFE_METHODS
+    g.current_user = User.check_api_token(token, use_cache=use_cache) if token else None
     return g.current_user is not None
 
 @token_auth.error_handler
@@ -0,0 +1,49 @@
+import hashlib
+from datetime import timezone
+
+from flask import current_app, request
+
+
+def make_etag(*parts):
+    """
+    Build an entity tag from values identifying a representation.
+
+    :param parts: any values with stable `repr`, e.g. IDs and update times.
+    :return: entity tag string.
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        # If-None-Match takes precedence and uses weak comparison (RFC 7232)
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    if last_modified is None or since is None:
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    # HTTP dates have one second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def conditional_response(etag, build_response, last_modified=None):
+    """
+    Make a response honouring `If-None-Match` and `If-Modified-Since`.
+
+    The response body is only built and serialized if the client's copy is
+    stale, otherwise '304 Not Modified' is returned.
+
+    :param str etag: entity tag of the current representation.
+    :param build_response: function returning Flask `Response` object.
+    :param datetime last_modified: naive UTC time the resource was last changed.
+    :return: Flask `Response` object.
+    """
+    if _not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = build_response()
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
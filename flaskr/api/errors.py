@@ -2,14 +2,16 @@ from flask import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
 
 
-def error_response(status_code, message=None):
+def error_response(status_code, message=None, results=None):
     payload = {'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error')}
     if message:
         payload['message'] = message
+    if results is not None:
+        payload['results'] = results
     response = jsonify(payload)
     response.status_code = status_code
     return response
 
 
-def bad_request(message):
-    return error_response(400, message)
+def bad_request(message, results=None):
+    return error_response(400, message, results)
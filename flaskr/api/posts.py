@@ -1,36 +1,198 @@
-from flask import abort, g, jsonify
+from datetime import datetime
+
+from flask import abort, current_app, g, jsonify, request, url_for
 
 from flaskr.api import api_bp
 from flaskr.api.auth import token_auth
-from flaskr.models import Post
+from flaskr.api.conditional import conditional_response, make_etag
+from flaskr.api.errors import bad_request
+from flaskr.api.streaming import stream_collection, wants_stream
+from flaskr.db import db, read_only
+from flaskr.models import Post, User
+from flaskr.pagination import InvalidCursor, get_page_args, keyset_page
+from flaskr.serializers import (
+    collection_json,
+    get_serializer,
+    json_response,
+    post_row_version,
+    post_rows,
+)
 
 
 @api_bp.route('/posts/<int:id_>', methods=['GET'])
 @token_auth.login_required
+@read_only
 def get_post(id_):
     """
     Get blog post with id = `id_`.
 
     :param int id_: post ID in database (primary key).
     :return: Flask `Response` object with added JSON representation of `Post` and
-    `Content-Type: application/json` HTTP header.
+    `Content-Type: application/json` HTTP header, or '304 Not Modified' if
+    the client's copy matches `ETag` or `Last-Modified`.
     """
     post = Post.query.get(id_) or abort(404)
     if g.current_user.id_ != post.author.id_:
         abort(403)
-    return jsonify(post.to_dict())
+    return conditional_response(
+        make_etag(post.version),
+        lambda: jsonify(post.to_dict()),
+        last_modified=max(post.updated, post.author.updated),
+    )
 
 
 @api_bp.route('/posts', methods=['GET'])
 @token_auth.login_required
+@read_only
 def get_all_posts():
     """
-    Get all posts available in database.
+    Get a page of posts, the newest first.
+
+    Accepts `limit` and `cursor` query parameters; cursors of the adjacent pages
+    are returned under the `_meta` key. With `stream=1` all posts are streamed
+    instead of a page.
+
+    :return: Flask `Response` object with added JSON representation of `Post`
+    objects of the page and `Content-Type: application/json` HTTP header, or
+    '304 Not Modified' if the client's copy matches `ETag`.
+    """
+    serializer = get_serializer('post')
+    if wants_stream():
+        rows = post_rows().order_by(Post.created.desc(), Post.id_.desc())
+        return stream_collection('posts', rows, serializer)
+    limit, cursor = get_page_args()
+    try:
+        page = keyset_page(
+            post_rows(),
+            (Post.created, Post.id_),
+            limit,
+            cursor,
+            descending=True,
+        )
+    except InvalidCursor:
+        return bad_request('Invalid cursor')
+    return conditional_response(
+        make_etag(
+            limit,
+            cursor,
+            [post_row_version(row) for row in page.items],
+            page.next_cursor,
+            page.prev_cursor,
+        ),
+        lambda: json_response(
+            collection_json('posts', page, serializer, 'api.get_all_posts'),
+        ),
+    )
+
+
+def _validate_post_data(post_data):
+    """
+    Check one item of a batch.
+
+    :param post_data: decoded JSON item.
+    :return: a list of error messages, empty if the item is valid.
+    """
+    if not isinstance(post_data, dict):
+        return ['Post must be a JSON object']
+    errors = []
+    title = post_data.get('title')
+    if not isinstance(title, str) or not title.strip():
+        errors.append('Title is required')
+    elif len(title) > Post.title.type.length:
+        errors.append('Title must be at most {} characters'.format(
+            Post.title.type.length,
+        ))
+    if not isinstance(post_data.get('body', ''), str):
+        errors.append('Body must be a string')
+    return errors
+
+
+def _insert_posts(rows):
+    """
+    Insert posts with one multi-row INSERT and get their IDs from it.
+
+    PostgreSQL returns the IDs with RETURNING. A multi-row INSERT of MySQL
+    (InnoDB) and SQLite gets consecutive IDs, and the driver reports the
+    first (MySQL) or the last (SQLite) one. Other databases insert row by row.
+
+    :param list rows: dictionaries of `post` table values.
+    :return: a list of IDs of the rows in the same order.
+    """
+    post_table = Post.__table__
+    dialect = db.session.get_bind(clause=post_table.insert()).dialect.name
+    if dialect == 'postgresql':
+        result = db.session.execute(
+            post_table.insert().values(rows).returning(post_table.c.id_),
+        )
+        return [row.id_ for row in result]
+    if dialect in ('mysql', 'sqlite'):
+        last_id = db.session.execute(post_table.insert().values(rows)).lastrowid
+        first_id = last_id if dialect == 'mysql' else last_id - len(rows) + 1
+        return list(range(first_id, first_id + len(rows)))
+    return [
+        db.session.execute(post_table.insert(), row).inserted_primary_key[0]
+        for row in rows
+    ]
+
 
-    :return: Flask `Response` object with added JSON representation of all `Post`
-    objects available and `Content-Type: application/json` HTTP header.
+@api_bp.route('/posts/batch', methods=['POST'])
+@token_auth.login_required
+def create_posts_batch():
     """
-    return jsonify(Post.to_collection_dict())
+    Create up to `API_BATCH_MAX` posts of the current user at once.
+
+    The request body is a JSON object with a list of posts with `title` and
+    optional `body` under the `posts` key. All posts are validated before
+    anything is written: if any of them is invalid, nothing is created and
+    the response lists errors of each item. Valid batches are inserted with
+    a single multi-row INSERT in one transaction, which also tells
+    the IDs of the new posts. With `links=1` every
+    result also gets the post's URL under the `location` key.
+
+    :return: Flask `Response` object with per-item results and IDs of the
+    created posts and `Content-Type: application/json` HTTP header.
+    """
+    data = request.get_json(silent=True)
+    batch = data.get('posts') if isinstance(data, dict) else None
+    if not isinstance(batch, list) or not batch:
+        return bad_request('A non-empty list of posts is required')
+    batch_max = current_app.config['API_BATCH_MAX']
+    if len(batch) > batch_max:
+        return bad_request('At most {} posts can be created at once'.format(batch_max))
+    results = [
+        {'index': index, 'errors': _validate_post_data(post_data)}
+        for index, post_data in enumerate(batch)
+    ]
+    if any(result['errors'] for result in results):
+        return bad_request('Invalid posts', results)
+
+    author_id = g.current_user.id_
+    now = datetime.utcnow()
+    ids = _insert_posts([
+        {
+            'author_id': author_id,
+            'created': now,
+            'updated': now,
+            'title': post_data['title'],
+            'body': post_data.get('body', ''),
+        }
+        for post_data in batch
+    ])
+    # Core inserts bypass `Post` mapper events which maintain the counter
+    db.session.execute(User.post_count_update(author_id, len(batch)))
+    db.session.commit()
+    current_app.extensions['fragment_cache'].invalidate()
+
+    with_links = request.args.get('links', '').lower() in ('1', 'true')
+    results = []
+    for index, id_ in enumerate(ids):
+        result = {'index': index, 'id': id_}
+        if with_links:
+            result['location'] = url_for('api.get_post', id_=id_)
+        results.append(result)
+    response = jsonify({'results': results, 'ids': ids, 'count': len(ids)})
+    response.status_code = 201
+    return response
 
 
 # TODO: add delete & edit endpoints
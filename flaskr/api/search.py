@@ -0,0 +1,51 @@
+from flask import jsonify, request, url_for
+from sqlalchemy.orm import joinedload
+
+from flaskr.api import api_bp
+from flaskr.api.auth import token_auth
+from flaskr.api.errors import bad_request
+from flaskr.db import read_only
+from flaskr.models import Post
+from flaskr.pagination import get_limit
+from flaskr.search import search_posts
+
+
+@api_bp.route('/search', methods=['GET'])
+@token_auth.login_required
+@read_only
+def search():
+    """
+    Full-text search over titles and bodies of posts.
+
+    Accepts `q`, `page` (1-based) and `limit` query parameters.
+
+    :return: Flask `Response` object with added JSON representation of found
+    `Post` objects, the most relevant first, and `Content-Type: application/json`
+    HTTP header.
+    """
+    terms = request.args.get('q', '').strip()
+    if not terms:
+        return bad_request('Search query is required')
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = get_limit()
+
+    found = search_posts(Post.query.options(joinedload(Post.author)), terms, page, limit)
+    posts = [post.to_dict() for post in found.items]
+
+    def link(page_number):
+        return url_for('api.search', q=terms, page=page_number, limit=limit)
+
+    return jsonify({
+        'posts': posts,
+        'count': len(posts),
+        '_meta': {
+            'q': terms,
+            'page': page,
+            'limit': limit,
+        },
+        '_links': {
+            'self': link(page),
+            'next': link(page + 1) if found.has_next else None,
+            'prev': link(page - 1) if page > 1 else None,
+        },
+    })
@@ -0,0 +1,43 @@
+from flask import Response, current_app, json, request, stream_with_context
+
+
+def wants_stream():
+    """
+    Check if client asked for the whole collection as a stream.
+
+    :return: `True` if `stream` query string parameter is set to 1 or true.
+    """
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+
+def stream_collection(name, query, serialize):
+    """
+    Stream all rows of `query` as a JSON object `{name: [...], "count": N}`.
+
+    Rows are fetched with `yield_per` and written chunk by chunk, so neither
+    the rows nor the JSON document are ever held in memory as a whole. `count`
+    goes after the list since it's only known at the end.
+
+    :param str name: collection key, e.g. 'posts'.
+    :param query: SQLAlchemy query with ORDER BY.
+    :param serialize: function converting a row into a JSON string.
+    :return: Flask `Response` object with streamed body.
+    """
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+
+    def generate():
+        yield '{{{}:['.format(json.dumps(name))
+        count = 0
+        chunk = []
+        for row in query.yield_per(chunk_size):
+            chunk.append(serialize(row))
+            if len(chunk) == chunk_size:
+                yield (',' if count else '') + ','.join(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            yield (',' if count else '') + ','.join(chunk)
+            count += len(chunk)
+        yield '],"count":{}}}'.format(count)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -1,35 +1,120 @@
-from flask import abort, g, jsonify, request, url_for
+from flask import abort, current_app, g, jsonify, request, url_for
 
 from flaskr.api import api_bp
 from flaskr.api.auth import token_auth
+from flaskr.api.conditional import conditional_response, make_etag
 from flaskr.api.errors import bad_request
-from flaskr.db import db
-from flaskr.models import User
+from flaskr.api.streaming import stream_collection, wants_stream
+from flaskr.db import db, read_only
+from flaskr.models import Post, User
+from flaskr.pagination import InvalidCursor, get_page_args, keyset_page
+from flaskr.serializers import (
+    collection_json,
+    get_serializer,
+    json_response,
+    post_row_version,
+    post_rows,
+    user_row_version,
+    user_rows,
+)
 
 
 @api_bp.route('/users/<int:id_>', methods=['GET'])
 @token_auth.login_required
+@read_only
 def get_user(id_):
     """
     Get User object with id = `id_`.
 
     :param int id_: a user ID from the database, actually a primary key.
     :return: Flask `Response` object with added JSON representation of `User` and
-    `Content-Type: application/json` HTTP header.
+    `Content-Type: application/json` HTTP header, or '304 Not Modified' if
+    the client's copy matches `ETag` or `Last-Modified`.
     """
-    return jsonify(User.query.get_or_404(id_).to_dict())
+    user = User.query.get_or_404(id_)
+    return conditional_response(
+        make_etag(user.version),
+        lambda: jsonify(user.to_dict()),
+        last_modified=user.updated,
+    )
 
 
 @api_bp.route('/users', methods=['GET'])
 @token_auth.login_required
+@read_only
 def get_all_users():
     """
-    Get all users available in database.
+    Get a page of users ordered by ID.
+
+    Accepts `limit` and `cursor` query parameters; cursors of the adjacent pages
+    are returned under the `_meta` key. With `stream=1` all users are streamed
+    instead of a page.
+
+    :return: Flask `Response` object with added JSON representation of `User`
+    objects of the page and `Content-Type: application/json` HTTP header, or
+    '304 Not Modified' if the client's copy matches `ETag`.
+    """
+    serializer = get_serializer('user')
+    if wants_stream():
+        return stream_collection('users', user_rows().order_by(User.id_), serializer)
+    limit, cursor = get_page_args()
+    try:
+        page = keyset_page(user_rows(), (User.id_,), limit, cursor)
+    except InvalidCursor:
+        return bad_request('Invalid cursor')
+    return conditional_response(
+        make_etag(
+            limit,
+            cursor,
+            [user_row_version(row) for row in page.items],
+            page.next_cursor,
+            page.prev_cursor,
+        ),
+        lambda: json_response(
+            collection_json('users', page, serializer, 'api.get_all_users'),
+        ),
+    )
+
 
-    :return: Flask `Response` object with added JSON representation of all `User`
-    objects available and `Content-Type: application/json` HTTP header.
+@api_bp.route('/users/<int:id_>/posts', methods=['GET'])
+@token_auth.login_required
+@read_only
+def get_user_posts(id_):
+    """
+    Get a page of posts of User with id = `id_`, the newest first.
+
+    Accepts the same `limit`, `cursor` and `stream` query parameters as
+    `get_all_posts`. Pages are read from the (author_id, created, id_) index.
+
+    :param int id_: a user ID from the database, actually a primary key.
+    :return: Flask `Response` object with added JSON representation of user's
+    `Post` objects of the page and `Content-Type: application/json` HTTP header,
+    or '304 Not Modified' if the client's copy matches `ETag`.
     """
-    return jsonify(User.to_collection_dict())
+    if db.session.query(User.id_).filter_by(id_=id_).scalar() is None:
+        abort(404)
+    serializer = get_serializer('post')
+    rows = post_rows().filter(Post.author_id == id_)
+    if wants_stream():
+        rows = rows.order_by(Post.created.desc(), Post.id_.desc())
+        return stream_collection('posts', rows, serializer)
+    limit, cursor = get_page_args()
+    try:
+        page = keyset_page(rows, (Post.created, Post.id_), limit, cursor, descending=True)
+    except InvalidCursor:
+        return bad_request('Invalid cursor')
+    return conditional_response(
+        make_etag(
+            limit,
+            cursor,
+            [post_row_version(row) for row in page.items],
+            page.next_cursor,
+            page.prev_cursor,
+        ),
+        lambda: json_response(
+            collection_json('posts', page, serializer, 'api.get_user_posts', id_=id_),
+        ),
+    )
 
 
 @api_bp.route('/users', methods=['POST'])
@@ -76,4 +161,6 @@ def update_user(id_):
         return bad_request('Please use a different username')
     user.from_dict(user_data, new_user=False)
     db.session.commit()
+    # Cached blog pages show authors' usernames
+    current_app.extensions['fragment_cache'].invalidate()
     return jsonify(user.to_dict())
@@ -4,12 +4,14 @@ from flask import (
     Blueprint,
     flash,
     g,
+    has_request_context,
     redirect,
     render_template,
     request,
     session,
     url_for,
 )
+from flask.ctx import _AppCtxGlobals
 
 from flaskr.db import get_db
 from flaskr.models import User
@@ -62,14 +64,55 @@ def login():
     return render_template('auth/login.html')
 
 
-@bp.before_app_request
 def load_logged_in_user():
-    """Check if user is logged in, and if so, add the user to Flask `g` object."""
+    """
+    Load the user whose ID is stored in the session.
+
+    :return: `User` object or `None` if nobody is logged in.
+    """
+    if not has_request_context():
+        return None
     user_id = session.get('user_id')
     if user_id is None:
-        g.user = None
-    else:
-        g.user = User.query.get(user_id)
+        return None
+    return User.query.get(user_id)
+
+
+class LazyUserGlobals(_AppCtxGlobals):
+    """
+    Flask `g` object which loads the logged in user on first access to `g.user`.
+
+    Requests which never read `g.user`, like static files, don't query the
+    database, and the loaded user is reused for the rest of the request.
+    `g.get('user')` and `'user' in g` load the user as well.
+    """
+
+    def __getattr__(self, name):
+        if name != 'user':
+            raise AttributeError(name)
+        self.user = load_logged_in_user()
+        return self.user
+
+    def get(self, name, default=None):
+        if name == 'user':
+            return self.user
+        return super().get(name, default)
+
+    def __contains__(self, item):
+        if item == 'user':
+            self.user
+        return super().__contains__(item)
+
+
+@bp.before_app_request
+def forget_logged_in_user():
+    """
+    Drop the user loaded by a previous request.
+
+    Several requests can run in one app context, e.g. in tests or CLI
+    commands, and the user may have logged in or out in between.
+    """
+    g.pop('user', None)
 
 
 @bp.route('/logout')
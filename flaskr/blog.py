@@ -1,19 +1,97 @@
-from flask import Blueprint, flash, g, redirect, render_template, request, url_for
-from sqlalchemy import desc
+from flask import (
+    Blueprint,
+    current_app,
+    flash,
+    g,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for,
+)
+from markupsafe import Markup
 from werkzeug.exceptions import abort
 
 from flaskr.auth import login_required
-from flaskr.db import get_db
+from flaskr.db import get_db, read_only, use_primary
 from flaskr.models import Post, User
+from flaskr.pagination import InvalidCursor, keyset_page
+from flaskr.search import search_posts
 
 bp = Blueprint('blog', __name__)
 
 
 @bp.route('/')
+@read_only
 def index():
-    """Show main app page."""
+    """
+    Show main app page with one page of posts, the newest first.
+
+    Anonymous visitors all see the same post list, so it's rendered once and
+    served from the fragment cache until a post is changed. A fragment about
+    to be cached is rendered from the primary, since a lagging replica could
+    put a stale page into the cache for everyone.
+    """
+    cursor = request.args.get('cursor') or None
+    cache = current_app.extensions['fragment_cache']
+    cacheable = 'user_id' not in session
+    posts_html = None
+    if cacheable:
+        generation = cache.generation()
+        posts_html = cache.get(cursor or '', generation)
+    if posts_html is None:
+        if cacheable:
+            use_primary()
+        try:
+            page = keyset_page(
+                _post_rows(),
+                (Post.created, Post.id_),
+                current_app.config['POSTS_PER_PAGE'],
+                cursor,
+                descending=True,
+            )
+        except InvalidCursor:
+            return redirect(url_for('blog.index'))
+        posts_html = render_template('blog/_posts.html', posts=page.items, page=page)
+        if cacheable:
+            cache.set(cursor or '', posts_html, generation)
+
+    return render_template('blog/index.html', posts_html=Markup(posts_html))
+
+
+@bp.route('/user/<username>')
+@read_only
+def user_posts(username):
+    """Show one page of posts of user `username`, the newest first."""
+    user = User.query.filter_by(username=username).first_or_404()
+    cursor = request.args.get('cursor') or None
+    try:
+        page = keyset_page(
+            _post_rows().filter(Post.author_id == user.id_),
+            (Post.created, Post.id_),
+            current_app.config['POSTS_PER_PAGE'],
+            cursor,
+            descending=True,
+        )
+    except InvalidCursor:
+        return redirect(url_for('blog.user_posts', username=username))
+    return render_template('blog/user.html', user=user, posts=page.items, page=page)
+
+
+@bp.route('/search')
+@read_only
+def search():
+    """Show posts matching the `q` query string parameter, the best match first."""
+    terms = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    found = search_posts(_post_rows(), terms, page, current_app.config['POSTS_PER_PAGE'])
+    return render_template('blog/search.html', q=terms, posts=found.items, found=found)
+
+
+def _post_rows():
+    """Query posts along with their authors' usernames for rendering."""
     db = get_db()
-    posts = db.session.query(
+    return db.session.query(
         Post.id_,
         Post.title,
         Post.body,
@@ -21,10 +99,7 @@ def index():
         Post.author_id,
         User.username,
     ).join(User).\
-        filter(Post.author_id == User.id_).\
-        order_by(desc(Post.created)).all()
-
-    return render_template('blog/index.html', posts=posts)
+        filter(Post.author_id == User.id_)
 
 
 @bp.route('/create', methods=('GET', 'POST'))
@@ -44,6 +119,7 @@ def create():
             post = Post(title=title, body=body, author_id=g.user.id_)
             db.session.add(post)
             db.session.commit()
+            current_app.extensions['fragment_cache'].invalidate()
             return redirect(url_for('blog.index'))
     return render_template('blog/create.html')
 
@@ -71,6 +147,7 @@ def update(id_):
             post.body = body
             db.session.add(post)
             db.session.commit()
+            current_app.extensions['fragment_cache'].invalidate()
             return redirect(url_for('blog.index'))
     return render_template('blog/update.html', post=post)
 
@@ -87,6 +164,7 @@ def delete(id_):
     post = get_post(id_)
     db.session.delete(post)
     db.session.commit()
+    current_app.extensions['fragment_cache'].invalidate()
     return redirect(url_for('blog.index'))
 
 
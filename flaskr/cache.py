@@ -0,0 +1,299 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+GENERATION_KEY = 'generation'
+# Generation outlives fragments, so it's the last entry to be evicted
+GENERATION_TTL = 24 * 60 * 60
+TMP_SUFFIX = '.tmp'
+
+
+class TTLCache:
+    """
+    In-process mapping with LRU eviction and per-entry expiration.
+
+    The cache is safe to share between threads of one worker process. Every
+    worker process has its own copy, so entries should expire soon enough for
+    the data they hold to be allowed to go stale for that long.
+    """
+
+    def __init__(self, maxsize, ttl, timer=time.monotonic):
+        """
+        :param int maxsize: maximum number of entries, 0 disables the cache.
+        :param float ttl: default entry lifetime in seconds.
+        :param timer: function returning current time in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Get a value which is not expired yet.
+
+        :param key: cache key.
+        :param default: value to return on a cache miss.
+        :return: cached value or `default`.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= self._timer():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        :param key: cache key.
+        :param value: value to store.
+        :param float ttl: entry lifetime in seconds, the cache's `ttl` by default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self._timer() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove an entry if it exists."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        :return: a dictionary with numbers of hits, misses and stored entries.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class FileSystemCache:
+    """
+    Cache of text values stored as files in a directory.
+
+    Unlike `TTLCache` it can be shared by all worker processes of a host.
+    Files are replaced atomically, so readers never see a partially written
+    value. When there are more than `threshold` files, expired and then the
+    oldest ones are removed.
+    """
+
+    def __init__(self, directory, ttl, threshold=500):
+        """
+        :param str directory: path to the directory holding cache files.
+        :param float ttl: default entry lifetime in seconds.
+        :param int threshold: maximum number of files kept in the directory.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._list_files())
+
+    def get(self, key, default=None):
+        """
+        Get a value which is not expired yet.
+
+        :param str key: cache key.
+        :param default: value to return on a cache miss.
+        :return: cached string or `default`.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as cache_file:
+                expires = float(cache_file.readline())
+                if expires > time.time():
+                    self.hits += 1
+                    return cache_file.read()
+        except (OSError, ValueError):
+            pass
+        else:
+            self._remove(path)
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a string value.
+
+        :param str key: cache key.
+        :param str value: value to store.
+        :param float ttl: entry lifetime in seconds, the cache's `ttl` by default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._prune()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TMP_SUFFIX)
+        with os.fdopen(fd, 'w', encoding='utf-8') as cache_file:
+            cache_file.write('{}\n'.format(time.time() + ttl))
+            cache_file.write(value)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        """Remove an entry if it exists."""
+        self._remove(self._path(key))
+
+    def clear(self):
+        """Remove all entries."""
+        for path in self._list_files():
+            self._remove(path)
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        :return: a dictionary with numbers of hits, misses and stored entries.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _list_files(self):
+        return [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if not name.endswith(TMP_SUFFIX)
+        ]
+
+    def _prune(self):
+        paths = self._list_files()
+        if len(paths) < self.threshold:
+            return
+        now = time.time()
+        entries = []
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as cache_file:
+                    expires = float(cache_file.readline())
+            except (OSError, ValueError):
+                continue
+            if expires <= now:
+                self._remove(path)
+            else:
+                entries.append((expires, path))
+        entries.sort()
+        for _, path in entries[:len(entries) - self.threshold + 1]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class FragmentCache:
+    """
+    Cache of rendered template fragments on top of `TTLCache` or
+    `FileSystemCache`.
+
+    Keys are prefixed with a generation stored in the backend itself.
+    Invalidation starts a new generation instead of deleting entries, so it's
+    seen by every process sharing the backend; with a per-process `TTLCache`
+    other processes only drop their fragments when they expire. Callers read
+    the generation once, before reading the data a fragment is rendered from,
+    and store the fragment under that generation: a fragment rendered from
+    data read before a concurrent invalidation then goes under the old
+    generation and is never served.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def generation(self):
+        """
+        Get the current generation, starting one if there's none.
+
+        :return: generation string to pass to `get` and `set`.
+        """
+        return self.backend.get(GENERATION_KEY) or self._new_generation()
+
+    def get(self, key, generation):
+        """
+        Get a rendered fragment.
+
+        :param str key: fragment key, e.g. a page cursor.
+        :param str generation: generation returned by `generation`.
+        :return: fragment string or `None`.
+        """
+        return self.backend.get(self._key(key, generation))
+
+    def set(self, key, fragment, generation):
+        """
+        Store a rendered fragment.
+
+        :param str key: fragment key, e.g. a page cursor.
+        :param str fragment: rendered template.
+        :param str generation: generation read before the data the fragment
+        was rendered from.
+        """
+        self.backend.set(self._key(key, generation), fragment)
+
+    def invalidate(self):
+        """Make all stored fragments stale."""
+        self._new_generation()
+
+    @staticmethod
+    def _key(key, generation):
+        return '{}:{}'.format(generation, key)
+
+    def _new_generation(self):
+        generation = uuid.uuid4().hex
+        self.backend.set(GENERATION_KEY, generation, ttl=GENERATION_TTL)
+        return generation
+
+
+def create_fragment_cache(config):
+    """
+    Create `FragmentCache` configured by `FRAGMENT_CACHE_*` app config values.
+
+    :param dict config: app config.
+    :return: `FragmentCache` object.
+    """
+    cache_type = config['FRAGMENT_CACHE_TYPE']
+    ttl = config['FRAGMENT_CACHE_TTL']
+    if cache_type == 'simple':
+        backend = TTLCache(config['FRAGMENT_CACHE_SIZE'], ttl)
+    elif cache_type == 'filesystem':
+        backend = FileSystemCache(
+            config['FRAGMENT_CACHE_DIR'],
+            ttl,
+            threshold=config['FRAGMENT_CACHE_SIZE'],
+        )
+    elif cache_type == 'null':
+        backend = TTLCache(0, 0)
+    else:
+        raise ValueError('Unknown FRAGMENT_CACHE_TYPE: {}'.format(cache_type))
+    return FragmentCache(backend)
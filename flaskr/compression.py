@@ -0,0 +1,161 @@
+import gzip
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, safe_join, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions of precompressed copies of static files by content coding
+STATIC_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _accepted_encodings():
+    """
+    Get content codings the client accepts, the preferred one first.
+
+    :return: a list of 'br' and 'gzip' values.
+    """
+    accepted = []
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        quality = request.accept_encodings[encoding]
+        if quality > 0:
+            accepted.append((quality, encoding == 'br', encoding))
+    return [encoding for *_, encoding in sorted(accepted, reverse=True)]
+
+
+def _compress(data, encoding):
+    config = current_app.config
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'])
+
+
+def compress_response(response):
+    """
+    Compress response body with gzip or brotli if the client accepts it.
+
+    Only buffered responses with one of `COMPRESS_MIMETYPES` which are at
+    least `COMPRESS_MIN_SIZE` bytes long are compressed; small bodies don't
+    get smaller, and streamed or file responses are left alone.
+
+    A compressed body is a different representation, so it can only be weakly
+    equal to the uncompressed one. ETags of all responses to a client which
+    accepts compression are made weak, so a 304 advertises the same validator
+    as the 200 it revalidates.
+    """
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or \
+            response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encodings = _accepted_encodings()
+    if not encodings:
+        return response
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    if response.status_code != 200 or response.direct_passthrough or \
+            response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.content_length is None or \
+            response.content_length < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(_compress(response.get_data(), encodings[0]))
+    response.headers['Content-Encoding'] = encodings[0]
+    return response
+
+
+def _serve_precompressed(send_static_file):
+    """Wrap the static files view to serve precompressed copies if they exist."""
+    def static(filename):
+        if not current_app.config['COMPRESS_ENABLED']:
+            return send_static_file(filename)
+        static_folder = current_app.static_folder
+        accepted = _accepted_encodings()
+        for encoding, suffix in STATIC_SUFFIXES:
+            if encoding in accepted and \
+                    _is_fresh_copy(static_folder, filename, filename + suffix):
+                break
+        else:
+            return send_static_file(filename)
+        response = send_from_directory(
+            static_folder,
+            filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0],
+        )
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    return static
+
+
+def _is_fresh_copy(static_folder, filename, copy_filename):
+    """Check that a compressed copy exists and is not older than the original."""
+    try:
+        return os.path.getmtime(safe_join(static_folder, copy_filename)) >= \
+            os.path.getmtime(safe_join(static_folder, filename))
+    except (OSError, NotFound):
+        return False
+
+
+def init_app(app):
+    """Enable response compression and serving of precompressed static files."""
+    app.after_request(compress_response)
+    if app.has_static_folder:
+        app.view_functions['static'] = _serve_precompressed(app.send_static_file)
+    app.cli.add_command(compress_static_command)
+
+
+def compress_static(static_folder, extensions, level=9):
+    """
+    Write compressed copies next to static files.
+
+    :param str static_folder: path to the static files directory.
+    :param tuple extensions: extensions of the files to compress.
+    :param int level: compression level.
+    :return: a list of paths of written files.
+    """
+    written = []
+    for root, _, filenames in os.walk(static_folder):
+        for filename in filenames:
+            if not filename.endswith(extensions):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as static_file:
+                data = static_file.read()
+            for encoding, suffix in STATIC_SUFFIXES:
+                if encoding == 'br':
+                    if brotli is None:
+                        continue
+                    compressed = brotli.compress(data, quality=11)
+                else:
+                    compressed = gzip.compress(data, compresslevel=level, mtime=0)
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as compressed_file:
+                    compressed_file.write(compressed)
+                written.append(path + suffix)
+    return written
+
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static_command():
+    """Command-line command for precompressing static files."""
+    written = compress_static(
+        current_app.static_folder,
+        tuple(current_app.config['COMPRESS_STATIC_EXTENSIONS']),
+    )
+    for path in written:
+        click.echo(path)
+    click.echo('{} compressed files written'.format(len(written)))
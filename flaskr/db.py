@@ -1,8 +1,28 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from functools import wraps
+
 import click
-from flask import g
-from flask.cli import with_appcontext
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask.cli import AppGroup, with_appcontext
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import MetaData, event, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.expression import CompoundSelect, Select, TextClause
+from werkzeug.security import generate_password_hash
+
+from flaskr.cache import FileSystemCache
 
 # Check this out for more details:
 # https://flask-sqlalchemy.palletsprojects.com/en/2.x/config/#using-custom-metadata-and-naming-conventions
@@ -14,7 +34,243 @@ naming_convention = {
     'pk': 'pk_%(table_name)s',
 }
 metadata = MetaData(naming_convention=naming_convention)
-db = SQLAlchemy(metadata=metadata)
+
+REPLICA_BIND_PREFIX = 'replica_'
+# Session key of the time of the user's last commit
+LAST_WRITE_KEY = 'last_write'
+
+
+class ReplicaRouter:
+    """
+    Picks replica binds round robin and remembers who wrote recently.
+
+    Replicas lag behind the primary, so users who committed something in the
+    last `sticky_seconds` read from the primary and see their own writes. The
+    next request of a user usually goes to another worker process, so the
+    time of the last write is kept where every worker sees it: in the session
+    cookie of browser users and in `recent_writers`, a cache directory shared
+    by the workers of a host, for API token users.
+    """
+
+    def __init__(self, bind_keys, sticky_seconds, writers_dir):
+        """
+        :param list bind_keys: keys of replica binds in `SQLALCHEMY_BINDS`.
+        :param float sticky_seconds: how long a writer reads from the primary.
+        :param str writers_dir: directory of the API writers cache, it's
+        only created if there are replicas.
+        """
+        self.bind_keys = list(bind_keys)
+        self.sticky_seconds = sticky_seconds
+        self.recent_writers = FileSystemCache(writers_dir, sticky_seconds) \
+            if self.bind_keys else None
+        self._cycle = itertools.cycle(self.bind_keys)
+        self._lock = threading.Lock()
+
+    def next_bind_key(self):
+        """Get the key of the next replica bind, `None` if there are no replicas."""
+        if not self.bind_keys:
+            return None
+        with self._lock:
+            return next(self._cycle)
+
+    def remember_writer(self):
+        """Make the user of the current request read from the primary for a while."""
+        user = g.get('current_user')
+        if user is not None:
+            self.recent_writers.set(str(user.id_), str(time.time()))
+        else:
+            session[LAST_WRITE_KEY] = time.time()
+
+    def wrote_recently(self):
+        """Check if the user of the current request committed something recently."""
+        user = g.get('current_user')
+        if user is not None:
+            return self.recent_writers.get(str(user.id_)) is not None
+        return time.time() - session.get(LAST_WRITE_KEY, 0) < self.sticky_seconds
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending SELECTs of read-only views to a replica.
+
+    A view marked with `read_only` gets a replica bind in `g.db_replica`, any
+    other statement goes to the primary. The replica is dropped as soon as
+    the session flushes, so a request never reads around its own writes.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind_key = g.get('db_replica') if has_request_context() else None
+        if bind_key is not None and _is_select(clause):
+            return self.db.get_engine(self.app, bind=bind_key)
+        return super().get_bind(mapper, clause)
+
+
+def _is_select(clause):
+    if isinstance(clause, (Select, CompoundSelect)):
+        return True
+    return isinstance(clause, TextClause) and \
+        clause.text.lstrip().upper().startswith('SELECT')
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """`SQLAlchemy` whose sessions route reads of read-only views to replicas."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy(metadata=metadata)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stop_reading_replica(db_session, flush_context):
+    if has_request_context():
+        g.pop('db_replica', None)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_writer(db_session):
+    if not has_request_context() or 'replicas' not in current_app.extensions:
+        return
+    router = current_app.extensions['replicas']
+    if router.bind_keys:
+        router.remember_writer()
+
+
+def init_replicas(app):
+    """
+    Add `REPLICA_DATABASE_URIS` to `SQLALCHEMY_BINDS` and create the router.
+
+    Must be called before `db.init_app`.
+    """
+    uris = app.config['REPLICA_DATABASE_URIS']
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    bind_keys = []
+    for index, uri in enumerate(uris):
+        bind_key = '{}{}'.format(REPLICA_BIND_PREFIX, index)
+        binds[bind_key] = uri
+        bind_keys.append(bind_key)
+    if binds:
+        app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replicas'] = ReplicaRouter(
+        bind_keys,
+        app.config['REPLICA_STICKY_SECONDS'],
+        app.config['REPLICA_WRITERS_DIR'],
+    )
+
+
+def use_primary():
+    """Send the rest of the current request's queries to the primary."""
+    g.pop('db_replica', None)
+
+
+def read_only(view):
+    """
+    Mark a view as only reading data, so its queries may go to a replica.
+
+    Place it below authentication decorators: authentication then runs
+    against the primary. Users who committed something recently keep
+    reading from the primary.
+    """
+    @wraps(view)
+    def wrapped_view(**kwargs):
+        router = current_app.extensions['replicas']
+        if router.bind_keys and not router.wrote_recently():
+            g.db_replica = router.next_bind_key()
+        return view(**kwargs)
+    return wrapped_view
+
+
+slow_query_logger = logging.getLogger('flaskr.sql')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """
+    Reduce SQL statement to its shape, so statements differing only in values
+    look the same in logs.
+
+    Literals and driver-specific placeholders become '?', lists of them such
+    as IN (...) collapse into '(...)' and whitespace is squeezed.
+
+    :param str statement: SQL statement.
+    :return: normalized statement.
+    """
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(...)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context():
+        g.db_query_count = g.get('db_query_count', 0) + 1
+        g.db_query_time = g.get('db_query_time', 0.0) + elapsed
+    if not has_app_context():
+        return
+    threshold = current_app.config['SLOW_QUERY_TIME']
+    if threshold and elapsed >= threshold:
+        slow_query_logger.warning(
+            'Slow query (%.3fs) in %s: %s',
+            elapsed,
+            request.endpoint if has_request_context() else 'cli',
+            normalize_statement(statement),
+        )
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_query_timer(context):
+    started = context.connection.info.get('query_started') \
+        if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def _add_server_timing(response):
+    """Report the request's number of queries, DB time and total time."""
+    total = time.perf_counter() - g.get('request_started', time.perf_counter())
+    response.headers.add(
+        'Server-Timing',
+        'db;dur={:.3f};desc="{} queries", total;dur={:.3f}'.format(
+            g.get('db_query_time', 0.0) * 1000,
+            g.get('db_query_count', 0),
+            total * 1000,
+        ),
+    )
+    return response
+
+
+def init_instrumentation(app):
+    """
+    Add `Server-Timing` header with per-request SQL statistics to responses.
+
+    Queries run while a streamed response is generated happen after the
+    headers are sent, so they aren't included.
+    """
+    if app.config['SERVER_TIMING']:
+        app.before_request(_start_request_timer)
+        app.after_request(_add_server_timing)
 
 
 def get_db():
@@ -39,3 +295,405 @@ def init_db_command():
     """Command-line command for creating all database tables."""
     init_db()
     click.echo('Database is initialized')
+
+
+@click.command('rebuild-post-counts')
+@with_appcontext
+def rebuild_post_counts_command():
+    """Command-line command for recalculating users' post counters."""
+    from flaskr.models import User
+    User.rebuild_post_counts()
+    db.session.commit()
+    click.echo('Post counters are rebuilt')
+
+
+@click.command('seed')
+@click.option('--users', default=100, type=click.IntRange(min=0),
+              help='Number of users.')
+@click.option('--posts', default=1000, type=click.IntRange(min=0),
+              help='Number of posts.')
+@click.option('--seed', default=0,
+              help='Random seed, the same seed gives the same data.')
+@click.option('--password', default='password', help='Password of every created user.')
+@click.option('--days', default=365.0, help='Time span of posts in days.')
+@click.option('--chunk-size', default=10000, type=click.IntRange(min=1),
+              help='Number of rows inserted in one transaction.')
+@with_appcontext
+def seed_command(users, posts, seed, password, days, chunk_size):
+    """
+    Command-line command for filling the database with synthetic data.
+
+    The password is hashed once and shared by all users.
+    """
+    from flaskr.seed import seed_database
+    started = time.perf_counter()
+    progress = seed_database(
+        users,
+        posts,
+        seed=seed,
+        password_hash=generate_password_hash(password),
+        days=days,
+        chunk_size=chunk_size,
+    )
+    try:
+        for table, inserted in progress:
+            elapsed = time.perf_counter() - started
+            click.echo('{}: {} rows inserted, {:.1f}s elapsed'.format(
+                table, inserted, elapsed,
+            ))
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    current_app.extensions['fragment_cache'].invalidate()
+    click.echo('Seeded {} users and {} posts in {:.1f}s'.format(
+        users, posts, time.perf_counter() - started,
+    ))
+
+
+import_cli = AppGroup('import', help='Import users or posts from JSON lines files.')
+
+
+def _decode_chunk(chunk):
+    """
+    Decode lines of a chunk into dictionaries.
+
+    :param list chunk: a list of (line number, line) tuples.
+    :return: a list of (line number, dictionary) tuples.
+    :raises ValueError: if a line is not a JSON object.
+    """
+    items = []
+    for line_number, line in chunk:
+        try:
+            item = json.loads(line)
+        except ValueError as error:
+            raise ValueError('line {}: {}'.format(line_number, error))
+        if not isinstance(item, dict):
+            raise ValueError('line {}: not a JSON object'.format(line_number))
+        items.append((line_number, item))
+    return items
+
+
+def _user_rows(chunk):
+    """Build `user` table rows from a chunk of lines."""
+    rows = []
+    for line_number, item in _decode_chunk(chunk):
+        if not item.get('username'):
+            raise ValueError('line {}: username is required'.format(line_number))
+        password_hash = item.get('password_hash')
+        if not password_hash:
+            if not item.get('password'):
+                raise ValueError(
+                    'line {}: password or password_hash is required'.format(line_number)
+                )
+            password_hash = generate_password_hash(item['password'])
+        rows.append({
+            'username': item['username'],
+            'password_hash': password_hash,
+            'first_name': item.get('first_name', ''),
+            'last_name': item.get('last_name', ''),
+        })
+    return rows
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _post_rows(chunk):
+    """
+    Build `post` table rows from a chunk of lines.
+
+    Authors are given either by `author_id` or by `author` username, both
+    are checked against the `user` table with one query per chunk each.
+    """
+    from flaskr.models import User
+    items = _decode_chunk(chunk)
+    usernames = {
+        item['author'] for _, item in items if isinstance(item.get('author'), str)
+    }
+    author_ids = dict(
+        db.session.query(User.username, User.id_).filter(User.username.in_(usernames))
+    ) if usernames else {}
+    ids = {item['author_id'] for _, item in items if _is_id(item.get('author_id'))}
+    known_ids = {
+        row.id_ for row in db.session.query(User.id_).filter(User.id_.in_(ids))
+    } if ids else set()
+    now = datetime.utcnow()
+    rows = []
+    for line_number, item in items:
+        if 'author_id' in item:
+            author_id = item['author_id'] if _is_id(item['author_id']) else None
+            if author_id not in known_ids:
+                author_id = None
+        elif isinstance(item.get('author'), str):
+            author_id = author_ids.get(item['author'])
+        else:
+            author_id = None
+        if author_id is None:
+            raise ValueError('line {}: unknown author'.format(line_number))
+        if not item.get('title'):
+            raise ValueError('line {}: title is required'.format(line_number))
+        created = item.get('created')
+        try:
+            created = datetime.fromisoformat(created) if created else now
+        except (TypeError, ValueError):
+            raise ValueError('line {}: invalid created time'.format(line_number))
+        rows.append({
+            'author_id': author_id,
+            'created': created,
+            'title': item['title'],
+            'body': item.get('body', ''),
+        })
+    return rows
+
+
+class ImportFailed(Exception):
+    """Raised when a chunk of an import fails, carries the line to resume from."""
+
+    def __init__(self, line_number, imported, error):
+        super().__init__(line_number, imported, error)
+        self.line_number = line_number
+        self.imported = imported
+        self.error = error
+
+    def __str__(self):
+        return 'Chunk starting at line {} failed: {}'.format(self.line_number, self.error)
+
+
+def import_lines(lines, table, build_rows, chunk_size, start_line=1, after_chunk=None):
+    """
+    Insert rows built from JSON lines in chunks, one transaction per chunk.
+
+    Lines are read lazily, so files of any size are imported in constant
+    memory. Every chunk is a single executemany followed by a commit; when a
+    chunk fails, it's rolled back and the import stops, leaving every previous
+    chunk in place, so it can be resumed from the failed chunk's first line.
+
+    :param lines: iterable of input lines.
+    :param table: SQLAlchemy `Table` to insert into.
+    :param build_rows: function turning a list of (line number, line) tuples
+    into a list of row dictionaries.
+    :param int chunk_size: number of lines per transaction.
+    :param int start_line: 1-based number of the first line to import.
+    :param after_chunk: function called with the inserted rows before commit.
+    :return: a generator of (last line number, number of imported rows)
+    tuples, one per committed chunk.
+    :raises ImportFailed: if a chunk couldn't be imported.
+    """
+    numbered = itertools.islice(enumerate(lines, start=1), start_line - 1, None)
+    numbered = ((number, line) for number, line in numbered if line.strip())
+    imported = 0
+    while True:
+        chunk = list(itertools.islice(numbered, chunk_size))
+        if not chunk:
+            return
+        try:
+            rows = build_rows(chunk)
+            db.session.execute(table.insert(), rows)
+            if after_chunk is not None:
+                after_chunk(rows)
+            db.session.commit()
+        except (ValueError, SQLAlchemyError) as error:
+            db.session.rollback()
+            raise ImportFailed(chunk[0][0], imported, error)
+        imported += len(rows)
+        yield chunk[-1][0], imported
+
+
+def _run_import(input_file, table, build_rows, chunk_size, start_line, after_chunk=None):
+    """Run `import_lines` reporting progress and throughput."""
+    started = time.perf_counter()
+    imported = 0
+    try:
+        for line_number, imported in import_lines(
+                input_file, table, build_rows, chunk_size, start_line, after_chunk):
+            elapsed = time.perf_counter() - started
+            click.echo('line {}: {} rows imported, {:.0f} rows/s'.format(
+                line_number, imported, imported / elapsed if elapsed else 0,
+            ))
+    except ImportFailed as error:
+        raise click.ClickException(
+            '{}\n{} rows before it are imported, fix the input and resume with '
+            '--start-line {}'.format(error, error.imported, error.line_number)
+        )
+    elapsed = time.perf_counter() - started
+    click.echo('Imported {} rows in {:.1f}s'.format(imported, elapsed))
+
+
+def _import_options(command):
+    command = click.option(
+        '--start-line', default=1, type=click.IntRange(min=1),
+        help='Number of the first line to import, to resume a failed import.',
+    )(command)
+    command = click.option(
+        '--chunk-size', default=1000, type=click.IntRange(min=1),
+        help='Number of lines inserted in one transaction.',
+    )(command)
+    return click.argument('input_file', type=click.File('r'))(command)
+
+
+@import_cli.command('users')
+@_import_options
+def import_users_command(input_file, chunk_size, start_line):
+    """
+    Import users from a JSON lines file.
+
+    Every line is an object with `username`, `first_name`, `last_name` and
+    either a `password_hash` taken as is or a `password` to hash.
+    """
+    from flaskr.models import User
+    _run_import(input_file, User.__table__, _user_rows, chunk_size, start_line)
+
+
+@import_cli.command('posts')
+@_import_options
+def import_posts_command(input_file, chunk_size, start_line):
+    """
+    Import posts from a JSON lines file.
+
+    Every line is an object with `title`, `body`, optional ISO 8601 `created`
+    time and either `author_id` or `author` username.
+    """
+    from flaskr.models import Post, User
+
+    def update_post_counts(rows):
+        # Core inserts bypass `Post` mapper events which maintain the counters
+        for author_id, count in Counter(row['author_id'] for row in rows).items():
+            db.session.execute(User.post_count_update(author_id, count))
+
+    try:
+        _run_import(
+            input_file,
+            Post.__table__,
+            _post_rows,
+            chunk_size,
+            start_line,
+            after_chunk=update_post_counts,
+        )
+    finally:
+        # Chunks committed before a failed one are visible as well
+        current_app.extensions['fragment_cache'].invalidate()
+
+
+export_cli = AppGroup('export', help='Export users or posts to JSON lines or CSV files.')
+
+
+@contextmanager
+def _open_export(path, compress):
+    """
+    Open a text stream writing to `path` or to stdout if it's '-'.
+
+    :param str path: output file path or '-'.
+    :param bool compress: whether to gzip the output.
+    """
+    with ExitStack() as stack:
+        if path == '-':
+            stream = click.get_binary_stream('stdout')
+        else:
+            stream = stack.enter_context(open(path, 'wb'))
+        if compress:
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode='wb'))
+        text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        try:
+            yield text
+        finally:
+            # Leave closing of the underlying streams to the exit stack
+            text.flush()
+            text.detach()
+
+
+def export_rows(query, serializer, output, output_format, chunk_size):
+    """
+    Write rows of `query` to `output` one by one.
+
+    Rows are fetched with `yield_per`, which also makes drivers supporting
+    server-side cursors stream results, so memory use doesn't depend on the
+    number of rows.
+
+    :param query: SQLAlchemy query selecting `serializer.columns` first.
+    :param serializer: `RowSerializer` of the rows.
+    :param output: text stream.
+    :param str output_format: 'jsonl' or 'csv'.
+    :param int chunk_size: number of rows fetched at once.
+    :return: number of written rows.
+    """
+    count = 0
+    rows = query.yield_per(chunk_size)
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(serializer.keys)
+        width = len(serializer.columns)
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row[:width])
+    else:
+        for count, row in enumerate(rows, start=1):
+            output.write(serializer(row))
+            output.write('\n')
+    return count
+
+
+def _export_options(command):
+    command = click.option(
+        '--gzip', 'compress', is_flag=True, help='Compress the output with gzip.',
+    )(command)
+    command = click.option(
+        '--output', '-o', default='-', help='Output file path, stdout by default.',
+    )(command)
+    command = click.option(
+        '--since', type=click.DateTime(formats=('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S')),
+        help='Export only rows changed at or after this UTC time.',
+    )(command)
+    return click.option(
+        '--format', 'output_format', type=click.Choice(('jsonl', 'csv')),
+        default='jsonl', show_default=True,
+    )(command)
+
+
+def _run_export(query, serializer, output_format, output, compress):
+    started = time.perf_counter()
+    with _open_export(output, compress) as text:
+        count = export_rows(
+            query,
+            serializer,
+            text,
+            output_format,
+            current_app.config['STREAM_CHUNK_SIZE'],
+        )
+    click.echo('Exported {} rows in {:.1f}s'.format(
+        count, time.perf_counter() - started,
+    ), err=True)
+
+
+@export_cli.command('posts')
+@_export_options
+def export_posts_command(output_format, since, output, compress):
+    """
+    Export posts with their authors, the oldest first.
+
+    With `--since` only posts created at or after the given time are
+    exported, for incremental loads.
+    """
+    from flaskr.models import Post
+    from flaskr.serializers import get_serializer, post_rows
+    query = post_rows()
+    if since is not None:
+        query = query.filter(Post.created >= since)
+    query = query.order_by(Post.created, Post.id_)
+    _run_export(query, get_serializer('post'), output_format, output, compress)
+
+
+@export_cli.command('users')
+@_export_options
+def export_users_command(output_format, since, output, compress):
+    """
+    Export users ordered by ID.
+
+    Users have no creation time, so with `--since` only users updated at or
+    after the given time are exported.
+    """
+    from flaskr.models import User
+    from flaskr.serializers import get_serializer, user_rows
+    query = user_rows()
+    if since is not None:
+        query = query.filter(User.updated >= since)
+    query = query.order_by(User.id_)
+    _run_export(query, get_serializer('user'), output_format, output, compress)
@@ -1,4 +1,4 @@
-from flask import request, render_template
+from flask import make_response, request, render_template
 from flaskr.api.errors import error_response as api_error_response
 
 
@@ -29,3 +29,25 @@ def forbidden_error(error):
     if wants_json_response():
         return api_error_response(403)
     return render_template('errors/403.html'), 403
+
+
+def too_many_requests_error(error):
+    if wants_json_response():
+        response = api_error_response(429)
+    else:
+        response = make_response(render_template('errors/429.html'), 429)
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def service_unavailable_error(error):
+    if wants_json_response():
+        response = api_error_response(503)
+    else:
+        response = make_response(render_template('errors/503.html'), 503)
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
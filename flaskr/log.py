@@ -0,0 +1,167 @@
+"""
+Application logging through a queue.
+
+Request threads only put records into an in-memory queue, a `QueueListener`
+thread formats them and writes them to the file, including rotation, so disk
+I/O never blocks request handling. Request details are attached to records
+by a filter on the queue handler, while the request context still exists.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+
+def get_request_id():
+    """
+    Get ID of the current request.
+
+    It's taken from the `X-Request-ID` header set by a proxy, or generated.
+
+    :return: request ID string.
+    """
+    if 'request_id' not in g:
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    return g.request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds `request_id`, `endpoint`, `method` and `path` to log records."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = get_request_id()
+            record.endpoint = request.endpoint
+            record.method = request.method
+            record.path = request.path
+        else:
+            record.request_id = record.endpoint = record.method = record.path = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        for field in ('request_id', 'endpoint', 'method', 'path'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class AppQueueHandler(QueueHandler):
+    """
+    Puts records into a bounded queue without blocking.
+
+    When the queue is full, because the writer can't keep up, records are
+    dropped and counted instead of making request threads wait.
+    """
+
+    def __init__(self, log_queue, listener):
+        super().__init__(log_queue)
+        self.listener = listener
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Unlike `QueueHandler.prepare` keep the traceback separate from the
+        # message, so the formatter of the writer decides how to render it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _create_writer(config):
+    """Create the handler which writes records in the listener thread."""
+    if config['LOG_FILE'] == '-':
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        directory = os.path.dirname(config['LOG_FILE'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(
+            filename=config['LOG_FILE'],
+            maxBytes=config['LOG_MAX_BYTES'],
+            backupCount=config['LOG_BACKUP_COUNT'],
+            encoding='utf-8',
+        )
+    log_format = config['LOG_FORMAT']
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    elif log_format == 'text':
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        raise ValueError('Unknown LOG_FORMAT: {}'.format(log_format))
+    handler.setLevel(logging.DEBUG)
+    return handler
+
+
+def _add_request_id_header(response):
+    response.headers[REQUEST_ID_HEADER] = get_request_id()
+    return response
+
+
+def _stop_listener(listener):
+    # `QueueListener.stop` fails if the listener was already stopped
+    if listener._thread is not None:
+        listener.stop()
+
+
+def init_app(app):
+    """
+    Send the app's log records through a queue to `LOG_FILE`.
+
+    Handlers installed by a previous call (in the same process) are replaced,
+    so records aren't written twice.
+    """
+    app.after_request(_add_request_id_header)
+    if app.debug:
+        return
+    for handler in list(app.logger.handlers):
+        if isinstance(handler, AppQueueHandler):
+            app.logger.removeHandler(handler)
+            _stop_listener(handler.listener)
+
+    log_queue = queue.Queue(app.config['LOG_QUEUE_SIZE'])
+    listener = QueueListener(log_queue, _create_writer(app.config))
+    queue_handler = AppQueueHandler(log_queue, listener)
+    queue_handler.addFilter(RequestContextFilter())
+    listener.start()
+    # Write out records still in the queue when the process exits
+    atexit.register(_stop_listener, listener)
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.DEBUG)
+    app.logger.info('Flaskr startup')
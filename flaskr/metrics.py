@@ -0,0 +1,115 @@
+"""
+Prometheus metrics served at `/metrics`.
+
+Every gunicorn worker is a separate process with its own counters. When the
+`prometheus_multiproc_dir` environment variable points to a directory shared
+by the workers (and emptied before they start), samples are written to files
+there instead, and `/metrics` served by any worker aggregates the whole
+process group.
+"""
+import os
+import time
+
+from flask import current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from flaskr.db import db
+from flaskr.pool import checkout_observers, pool_status
+
+MULTIPROCESS_DIR_ENV = 'prometheus_multiproc_dir'
+LABELS = ('endpoint', 'method', 'status')
+
+REQUESTS = Counter(
+    'flaskr_http_requests_total',
+    'Number of handled HTTP requests.',
+    LABELS,
+)
+REQUEST_LATENCY = Histogram(
+    'flaskr_http_request_duration_seconds',
+    'Time spent handling HTTP requests.',
+    LABELS,
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+IN_PROGRESS = Gauge(
+    'flaskr_http_requests_in_progress',
+    'Number of HTTP requests being handled.',
+    multiprocess_mode='livesum',
+)
+POOL_CHECKED_OUT = Gauge(
+    'flaskr_db_pool_checked_out',
+    'Number of database connections in use.',
+    multiprocess_mode='livesum',
+)
+POOL_CAPACITY = Gauge(
+    'flaskr_db_pool_capacity',
+    'Maximum number of database connections, pool size plus overflow.',
+    multiprocess_mode='livesum',
+)
+POOL_CHECKOUT_LATENCY = Histogram(
+    'flaskr_db_pool_checkout_seconds',
+    'Time spent waiting for a database connection from the pool.',
+    buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 10, 30),
+)
+checkout_observers.append(POOL_CHECKOUT_LATENCY.observe)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    IN_PROGRESS.inc()
+
+
+def _record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        labels = (request.endpoint or 'none', request.method, str(response.status_code))
+        REQUESTS.labels(*labels).inc()
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+    if not current_app.config['SQLALCHEMY_DATABASE_URI']:
+        return response
+    status = pool_status(db.engine)
+    if status is not None:
+        POOL_CHECKED_OUT.set(status['checked_out'])
+        POOL_CAPACITY.set(status['size'] + max(status['max_overflow'], 0))
+    return response
+
+
+def _finish_request(exception):
+    # Runs even if the request failed before `after_request` hooks
+    if g.pop('metrics_started', None) is not None:
+        IN_PROGRESS.dec()
+
+
+def metrics():
+    """
+    Render all metrics in Prometheus text format.
+
+    :return: Flask `Response` object.
+    """
+    if MULTIPROCESS_DIR_ENV in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return current_app.response_class(
+        generate_latest(registry),
+        content_type=CONTENT_TYPE_LATEST,
+    )
+
+
+def init_app(app):
+    """Collect request metrics and serve them at `/metrics` if `METRICS_ENABLED`."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -2,9 +2,46 @@ import base64
 import os
 from datetime import datetime, timedelta
 
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import joinedload, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 
-from flaskr.db import db
+from flaskr.db import RoutingSession, db
+from flaskr.pagination import collection_meta, keyset_page
+
+# `User` columns kept in the token cache. Columns which change without
+# touching the user row through the ORM (like `post_count`) or which aren't
+# needed to serve a request (like `password_hash`) are left out.
+TOKEN_CACHE_FIELDS = (
+    'id_',
+    'username',
+    'first_name',
+    'last_name',
+    'api_token',
+    'api_token_expiration',
+)
+
+
+# Session info key of API tokens to remove from the token cache on commit
+EVICTED_TOKENS_KEY = 'evicted_api_tokens'
+
+
+def _token_cache():
+    """Get the app's cache of verified API tokens."""
+    return current_app.extensions['token_cache']
+
+
+def _evict_token_on_commit(session, token):
+    """
+    Remove `token` from the token cache once `session` commits.
+
+    Evicting earlier would let a concurrent request cache the row which is
+    still committed, and keep honouring a revoked token until the entry
+    expires.
+    """
+    if token and session is not None:
+        session.info.setdefault(EVICTED_TOKENS_KEY, set()).add(token)
 
 
 class User(db.Model):
@@ -17,7 +54,16 @@ class User(db.Model):
     last_name = db.Column(db.String(80), unique=False, nullable=False, default='')
     api_token = db.Column(db.String(32), unique=True, index=True)
     api_token_expiration = db.Column(db.DateTime)
-    posts = db.relationship('Post', backref='author', lazy=True)
+    # Denormalized number of user's posts, maintained by `Post` mapper events
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+    # A query, so listing user's posts can filter, order and paginate in SQL
+    posts = db.relationship('Post', backref='author', lazy='dynamic')
 
     def __repr__(self):
         return '<User(username={}, first_name={}, last_name={})>'.format(
@@ -31,7 +77,7 @@ class User(db.Model):
 
         :param str password: not hashed user's password.
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = current_app.extensions['password_hasher'].generate(password)
 
     def check_password(self, password):
         """Check that given password's hash matches with one stored in database.
@@ -39,7 +85,8 @@ class User(db.Model):
         :param str password: not hashed user's password.
         :return: True if passwords matches, False otherwise.
         """
-        return check_password_hash(self.password_hash, password)
+        hasher = current_app.extensions['password_hasher']
+        return hasher.check(self.password_hash, password)
 
     def get_api_token(self, expires_in_sec=3600):
         """
@@ -52,6 +99,7 @@ class User(db.Model):
         now = datetime.utcnow()
         if self.api_token and self.api_token_expiration > now + timedelta(seconds=60):
             return self.api_token
+        _evict_token_on_commit(db.session, self.api_token)
         self.api_token = base64.b64encode(os.urandom(24)).decode('utf-8')
         self.api_token_expiration = now + timedelta(seconds=expires_in_sec)
         db.session.add(self)
@@ -59,22 +107,58 @@ class User(db.Model):
 
     def revoke_api_token(self):
         """Make the token be expired."""
+        _evict_token_on_commit(db.session, self.api_token)
         self.api_token_expiration = datetime.utcnow() - timedelta(seconds=1)
 
     @staticmethod
-    def check_api_token(token):
+    def check_api_token(token, use_cache=True):
         """
         Check if API token exists or expired.
-        
+
+        Recently verified tokens are served from the token cache without
+        querying the database, the cache entry never outlives the token.
+        Every worker process has its own cache, so a token revoked through
+        another worker is honoured until its entry expires after
+        `TOKEN_CACHE_TTL` seconds; pass `use_cache=False` where that's not
+        acceptable.
+
         :param str token: REST API token.
+        :param bool use_cache: accept a token found in the token cache.
         :return: `User` object the `token` belongs to if such exists
         and not expired, `None` otherwise.
         """
+        cache = _token_cache()
+        now = datetime.utcnow()
+        state = cache.get(token) if use_cache else None
+        if state is not None and state['api_token_expiration'] > now:
+            return User._from_cached_state(state)
+
         user = User.query.filter_by(api_token=token).first()
-        if user is None or user.api_token_expiration < datetime.utcnow():
+        if user is None or user.api_token_expiration < now:
             return None
+        cache.set(
+            token,
+            {field: getattr(user, field) for field in TOKEN_CACHE_FIELDS},
+            ttl=min(cache.ttl, (user.api_token_expiration - now).total_seconds()),
+        )
         return user
 
+    @staticmethod
+    def _from_cached_state(state):
+        """
+        Attach a `User` built from cached column values to the current session
+        without loading it from the database. Columns missing from `state` are
+        loaded on first access.
+
+        :param dict state: values of `TOKEN_CACHE_FIELDS`.
+        :return: `User` object.
+        """
+        user = User()
+        for field, value in state.items():
+            set_committed_value(user, field, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
     def to_dict(self):
         """Convert `User` object to dictionary."""
         user_dict = {
@@ -82,7 +166,7 @@ class User(db.Model):
             'username': self.username,
             'first_name': self.first_name,
             'last_name': self.last_name,
-            'post_count': len(self.posts),
+            'post_count': self.post_count,
         }
         return user_dict
 
@@ -103,18 +187,67 @@ class User(db.Model):
             self.set_password(user_dict['password'])
 
     @staticmethod
-    def to_collection_dict():
+    def post_count_update(user_id, delta):
+        """
+        Build an UPDATE statement changing user's `post_count` by `delta`.
+
+        The counter is changed by the database itself, so concurrent writers
+        don't overwrite each other's increments.
+
+        :param int user_id: ID of the user whose counter should be changed.
+        :param int delta: number of posts created (or deleted, if negative).
+        :return: SQLAlchemy Core `Update` object.
+        """
+        user_table = User.__table__
+        return user_table.update().\
+            where(user_table.c.id_ == user_id).\
+            values(
+                post_count=user_table.c.post_count + delta,
+                updated=datetime.utcnow(),
+            )
+
+    @staticmethod
+    def rebuild_post_counts():
+        """Recalculate `post_count` of every user from the `post` table."""
+        post_count = select([func.count(Post.id_)]).\
+            where(Post.author_id == User.id_).\
+            as_scalar()
+        db.session.query(User).\
+            filter(User.post_count != post_count).\
+            update(
+                {User.post_count: post_count, User.updated: datetime.utcnow()},
+                synchronize_session=False,
+            )
+
+    @property
+    def version(self):
+        """Values which change whenever `to_dict` representation changes."""
+        return (self.id_, self.updated)
+
+    @staticmethod
+    def get_page(limit, cursor=None):
+        """
+        Get one page of users ordered by `id_`.
+
+        :param int limit: page size.
+        :param str cursor: opaque cursor of the page, `None` for the first page.
+        :return: `Page` object.
+        :raises InvalidCursor: if `cursor` is malformed.
         """
-        Create a dictionary of User's dictionaries.
+        return keyset_page(User.query, (User.id_,), limit, cursor)
 
+    @staticmethod
+    def to_collection_dict(page, endpoint, **kwargs):
+        """
+        Create a dictionary of User's dictionaries for a page of users.
+
+        :param Page page: page returned by `get_page`.
+        :param str endpoint: endpoint name used to build `_links`.
+        :param kwargs: additional arguments for `url_for`.
         :return: a dictionary with `User` class attributes.
         """
-        users = [user.to_dict() for user in User.query.all()]
-        users_collection = {
-            'users': users,
-            'count': len(users),
-        }
-        return users_collection
+        users = [user.to_dict() for user in page.items]
+        return _collection_dict('users', users, page, endpoint, **kwargs)
 
 
 class Post(db.Model):
@@ -123,9 +256,22 @@ class Post(db.Model):
     id_ = db.Column(db.Integer, primary_key=True)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id_'), nullable=False)
     created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
     title = db.Column(db.String(80), nullable=False)
     body = db.Column(db.Text, nullable=False)
 
+    __table_args__ = (
+        # Backs keyset pagination over (created, id_), the newest posts first
+        db.Index('ix_post_created_desc', created.desc(), id_.desc()),
+        # Backs the same pagination over posts of one author
+        db.Index('ix_post_author_created_desc', author_id, created.desc(), id_.desc()),
+    )
+
     def __repr__(self):
         return '<Post(id={}, author_id={}, created={}, title={})>'.format(
             self.id_,
@@ -138,39 +284,75 @@ class Post(db.Model):
         """
         Convert `Post` object into dictionary.
 
+        Author fields are read from the `author` relationship, so eager load it
+        (see `to_collection_dict`) when serializing many posts to avoid a query
+        per post.
+
         :return: a dictionary with `Post` class attributes as dictionary and some
         `User` fields under `author` key.
         """
-        author = db.session.query(
-            User.username,
-            User.first_name,
-            User.last_name,
-        ).filter(self.author_id == User.id_).first()
-
         post_dict = {
             'id': self.id_,
             'author_id': self.author_id,
-            'author': dict(zip(('username', 'first_name', 'last_name'), author)),
+            'author': {
+                'username': self.author.username,
+                'first_name': self.author.first_name,
+                'last_name': self.author.last_name,
+            },
             'created': str(self.created),
             'title': self.title,
             'body': self.body,
         }
         return post_dict
 
+    @property
+    def version(self):
+        """
+        Values which change whenever `to_dict` representation changes.
+
+        Only the author's fields shown in the post are included, since the
+        author's `updated` also changes with their post counter.
+        """
+        author = self.author
+        return (
+            self.id_,
+            self.updated,
+            author.username,
+            author.first_name,
+            author.last_name,
+        )
+
     @staticmethod
-    def to_collection_dict():
+    def get_page(limit, cursor=None):
         """
-        Create a dictionary of Post's dictionaries.
+        Get one page of posts ordered from the newest to the oldest.
+        Posts are loaded together with their authors in a single query.
 
-        :return: a dictionary with `Post` class attributes as dictionary.
+        :param int limit: page size.
+        :param str cursor: opaque cursor of the page, `None` for the first page.
+        :return: `Page` object.
+        :raises InvalidCursor: if `cursor` is malformed.
         """
-        posts = [post.to_dict() for post in Post.query.all()]
-        posts_collection = {
-            'posts': posts,
-            'count': len(posts),
-        }
-        return posts_collection
+        return keyset_page(
+            Post.query.options(joinedload(Post.author)),
+            (Post.created, Post.id_),
+            limit,
+            cursor,
+            descending=True,
+        )
 
+    @staticmethod
+    def to_collection_dict(page, endpoint, **kwargs):
+        """
+        Create a dictionary of Post's dictionaries for a page of posts.
+
+        :param Page page: page returned by `get_page`.
+        :param str endpoint: endpoint name used to build `_links`.
+        :param kwargs: additional arguments for `url_for`.
+        :return: a dictionary with `Post` class attributes as dictionary.
+        """
+        posts = [post.to_dict() for post in page.items]
+        return _collection_dict('posts', posts, page, endpoint, **kwargs)
 
     def from_dict(self, post_dict):
         """
@@ -181,3 +363,60 @@ class Post(db.Model):
         for field in ('authod_id', 'created', 'title', 'body'):
             if field in post_dict:
                 setattr(self, field, post_dict[field])
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_cached_token(mapper, connection, user):
+    _evict_token_on_commit(object_session(user), user.api_token)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _evict_cached_tokens(session):
+    tokens = session.info.pop(EVICTED_TOKENS_KEY, ())
+    if tokens and has_app_context():
+        cache = _token_cache()
+        for token in tokens:
+            cache.delete(token)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _keep_cached_tokens(session):
+    session.info.pop(EVICTED_TOKENS_KEY, None)
+
+
+@event.listens_for(Post, 'after_insert')
+def _increment_post_count(mapper, connection, post):
+    connection.execute(User.post_count_update(post.author_id, 1))
+
+
+@event.listens_for(Post, 'after_delete')
+def _decrement_post_count(mapper, connection, post):
+    connection.execute(User.post_count_update(post.author_id, -1))
+
+
+@event.listens_for(Post, 'after_update')
+def _move_post_count(mapper, connection, post):
+    history = get_history(post, 'author_id')
+    for author_id in history.deleted:
+        connection.execute(User.post_count_update(author_id, -1))
+    for author_id in history.added:
+        connection.execute(User.post_count_update(author_id, 1))
+
+
+def _collection_dict(name, items, page, endpoint, **kwargs):
+    """
+    Wrap one page of serialized items with pagination metadata.
+
+    :param str name: collection key, e.g. 'posts'.
+    :param list items: serialized items of the page.
+    :param Page page: page the items belong to.
+    :param str endpoint: endpoint name used to build `_links`.
+    :param kwargs: additional arguments for `url_for`.
+    :return: a dictionary with items, their count, cursors and links.
+    """
+    collection = {
+        name: items,
+        'count': len(items),
+    }
+    collection.update(collection_meta(page, endpoint, **kwargs))
+    return collection
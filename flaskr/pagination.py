@@ -0,0 +1,180 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+Page = namedtuple('Page', ('items', 'next_cursor', 'prev_cursor', 'limit', 'cursor'))
+
+NEXT = 'n'
+PREV = 'p'
+
+# Integer keys must fit into the databases' 64-bit integer columns
+MIN_INT_KEY = -2 ** 63
+MAX_INT_KEY = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+def encode_cursor(values, direction=NEXT):
+    """
+    Pack keyset values into an opaque URL-safe string.
+
+    :param tuple values: values of the ordering columns of a boundary row.
+    :param str direction: `NEXT` or `PREV`.
+    :return: cursor string.
+    """
+    payload = {
+        'd': direction,
+        'k': [value.isoformat() if isinstance(value, datetime) else value
+              for value in values],
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Unpack a cursor created by `encode_cursor`.
+
+    :param str cursor: cursor string received from a client.
+    :param tuple columns: ordering columns the cursor was built for.
+    :return: a tuple of (values, direction).
+    :raises InvalidCursor: if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        direction = payload['d']
+        values = payload['k']
+        if direction not in (NEXT, PREV) or len(values) != len(columns):
+            raise InvalidCursor(cursor)
+        values = tuple(
+            datetime.fromisoformat(value)
+            if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        )
+        if any(isinstance(value, int) and not MIN_INT_KEY <= value <= MAX_INT_KEY
+               for value in values):
+            raise InvalidCursor(cursor)
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError,
+            OverflowError):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+def get_limit():
+    """
+    Read page size from the `limit` query string parameter.
+
+    The limit is clamped to the range [1, `MAX_PAGE_SIZE`] and defaults to
+    `PAGE_SIZE` from the app config.
+
+    :return: page size.
+    """
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+
+def get_page_args():
+    """
+    Read `limit` and `cursor` from the query string.
+
+    :return: a tuple of (limit, cursor).
+    """
+    return get_limit(), request.args.get('cursor') or None
+
+
+def _seek(columns, values, descending):
+    """Build a WHERE clause selecting rows strictly after `values` in sort order."""
+    clauses = []
+    for index, column in enumerate(columns):
+        equal = [col == value for col, value in zip(columns[:index], values[:index])]
+        if descending:
+            clauses.append(and_(*equal, column < values[index]))
+        else:
+            clauses.append(and_(*equal, column > values[index]))
+    return or_(*clauses)
+
+
+def _key(item, columns):
+    return tuple(getattr(item, column.key) for column in columns)
+
+
+def keyset_page(query, columns, limit, cursor=None, descending=False):
+    """
+    Fetch one page of `query` using keyset (seek) pagination.
+
+    Unlike OFFSET, the cost of a page doesn't depend on how deep it is as long
+    as `columns` are covered by an index.
+
+    :param query: SQLAlchemy query without ORDER BY.
+    :param tuple columns: unique combination of columns to order by.
+    :param int limit: page size.
+    :param str cursor: cursor of the page boundary, `None` for the first page.
+    :param bool descending: sort from the largest to the smallest key.
+    :return: `Page` object.
+    :raises InvalidCursor: if `cursor` is malformed.
+    """
+    direction = NEXT
+    if cursor is not None:
+        values, direction = decode_cursor(cursor, columns)
+        seek_descending = descending != (direction == PREV)
+        query = query.filter(_seek(columns, values, descending=seek_descending))
+
+    reverse = direction == PREV
+    if descending != reverse:
+        query = query.order_by(*(column.desc() for column in columns))
+    else:
+        query = query.order_by(*columns)
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    if reverse:
+        items.reverse()
+    if not items:
+        return Page(items, None, None, limit, cursor)
+
+    has_next = has_more if not reverse else True
+    has_prev = has_more if reverse else cursor is not None
+    return Page(
+        items,
+        encode_cursor(_key(items[-1], columns), NEXT) if has_next else None,
+        encode_cursor(_key(items[0], columns), PREV) if has_prev else None,
+        limit,
+        cursor,
+    )
+
+
+def collection_meta(page, endpoint, **kwargs):
+    """
+    Build pagination metadata of a collection response.
+
+    :param Page page: page the response is made of.
+    :param str endpoint: endpoint name used to build `_links`.
+    :param kwargs: additional arguments for `url_for`.
+    :return: a dictionary with `_meta` (limit and cursors) and `_links` keys.
+    """
+    def link(cursor):
+        if cursor is None:
+            return None
+        return url_for(endpoint, limit=page.limit, cursor=cursor, **kwargs)
+
+    return {
+        '_meta': {
+            'limit': page.limit,
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        },
+        '_links': {
+            'self': url_for(endpoint, limit=page.limit, cursor=page.cursor, **kwargs),
+            'next': link(page.next_cursor),
+            'prev': link(page.prev_cursor),
+        },
+    }
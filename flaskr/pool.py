@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Checkouts waiting longer than this many seconds are logged
+SLOW_CHECKOUT = 0.1
+# Number of the latest checkout latencies percentiles are computed from
+LATENCY_SAMPLES = 1000
+# Functions called with latency of every checkout of an instrumented pool
+checkout_observers = []
+
+
+class PoolMetrics:
+    """
+    Checkout latency and usage counters of one connection pool.
+
+    Latency is the time a thread waits for a connection, including opening a
+    new one. High percentiles or timeouts with `peak_checked_out` at the
+    pool's capacity mean the pool is too small for the worker's threads.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.peak_checked_out = 0
+        self._samples = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def observe_checkout(self, latency, checked_out):
+        """
+        Record a successful checkout.
+
+        :param float latency: seconds the checkout took.
+        :param int checked_out: number of connections in use after it.
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self._samples.append(latency)
+            if latency >= SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+    def observe_timeout(self):
+        """Record a checkout which gave up after `pool_timeout`."""
+        with self._lock:
+            self.timeouts += 1
+
+    def percentile(self, percent):
+        """
+        Get checkout latency percentile over the latest checkouts.
+
+        :param float percent: percentile, e.g. 95.
+        :return: latency in seconds, 0 if there were no checkouts.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+    def stats(self):
+        """
+        Get the counters.
+
+        :return: a dictionary of checkout counts and latencies in seconds.
+        """
+        return {
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'slow_checkouts': self.slow_checkouts,
+            'latency_avg': self.latency_total / self.checkouts if self.checkouts else 0.0,
+            'latency_max': self.latency_max,
+            'latency_p50': self.percentile(50),
+            'latency_p95': self.percentile(95),
+            'latency_p99': self.percentile(99),
+            'peak_checked_out': self.peak_checked_out,
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """`QueuePool` which records checkout latency into `metrics`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe_timeout()
+            logger.warning('Connection pool checkout timed out: %s', self.status())
+            raise
+        latency = time.perf_counter() - started
+        self.metrics.observe_checkout(latency, self.checkedout())
+        for observe in checkout_observers:
+            observe(latency)
+        if latency >= SLOW_CHECKOUT:
+            logger.warning(
+                'Connection pool checkout took %.3fs: %s', latency, self.status(),
+            )
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        # Keep counting across pool recreation after a disconnect
+        pool.metrics = self.metrics
+        return pool
+
+
+def pool_status(engine):
+    """
+    Get current usage and metrics of the engine's connection pool.
+
+    :param engine: SQLAlchemy `Engine` object.
+    :return: a dictionary with pool size, connections in use and utilization,
+    the share of the pool's capacity in use, plus `PoolMetrics.stats` if the
+    pool is instrumented; `None` if the pool isn't a `QueuePool`.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    status = {
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_out': checked_out,
+        'overflow': pool.overflow(),
+        'utilization': checked_out / capacity if capacity else 0.0,
+    }
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        status.update(metrics.stats())
+    return status
+
+
+def engine_options(config):
+    """
+    Build SQLAlchemy engine options from `DB_POOL_*` app config values.
+
+    SQLite databases are local files, Flask-SQLAlchemy opens them without a
+    pool, so no options are set for them.
+
+    :param dict config: app config.
+    :return: a dictionary of `create_engine` keyword arguments.
+    """
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not uri or make_url(uri).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
@@ -0,0 +1,355 @@
+"""
+Token bucket rate limiting of expensive endpoints.
+
+Every rule of an endpoint keeps one bucket per key value (client IP,
+username, username and client IP, or API token) holding up to `capacity`
+tokens, refilled at `rate` tokens per second. A request takes a token from
+each bucket of its endpoint and is rejected with 429 if one of them is empty,
+so clients can make short bursts but not exceed the average rate. A rejected
+request doesn't take tokens from any bucket.
+
+Behind reverse proxies `request.remote_addr` is the address of the nearest
+proxy, set `RATELIMIT_TRUST_PROXY` to the number of proxies to take the
+client IP from their `X-Forwarded-For` header instead.
+"""
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+RULE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\w+?)s?\s+per\s+(\w+)\s*$')
+
+Limit = namedtuple('Limit', ('capacity', 'rate', 'key'))
+
+
+class RateLimitExceeded(TooManyRequests):
+    """Raised when a request is over one of its endpoint's limits."""
+
+    description = 'Too many requests, please retry later.'
+
+
+def parse_limit(rule):
+    """
+    Parse a limit rule like `'5/minute per ip'`.
+
+    :param str rule: `<requests>/<second|minute|hour|day> per <key>`, where
+    the key is one of `KEY_FUNCTIONS`.
+    :return: `Limit` object.
+    """
+    match = RULE_RE.match(rule)
+    if match is None or match.group(2) not in PERIODS or \
+            match.group(3) not in KEY_FUNCTIONS:
+        raise ValueError('Invalid rate limit rule: {!r}'.format(rule))
+    capacity = int(match.group(1))
+    return Limit(capacity, capacity / PERIODS[match.group(2)], match.group(3))
+
+
+def take_token(tokens, updated, now, capacity, rate):
+    """
+    Refill a bucket and take a token from it.
+
+    :param float tokens: tokens in the bucket at `updated`, `None` for a new
+    bucket, which is full.
+    :param float updated: time of the bucket's last update.
+    :param float now: current time.
+    :param int capacity: maximum number of tokens.
+    :param float rate: tokens added per second.
+    :return: tuple of tokens left and seconds to wait for a token, 0 if the
+    token was taken.
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """
+    Buckets kept in the worker's memory.
+
+    Every worker process counts separately, so clients get up to the number
+    of workers times the limit. At most `maxsize` buckets are kept; the least
+    recently used one is dropped, which refills it.
+    """
+
+    def __init__(self, maxsize=10000, timer=time.monotonic):
+        """
+        :param int maxsize: maximum number of buckets.
+        :param timer: function returning current time in seconds.
+        """
+        self.maxsize = maxsize
+        self._timer = timer
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """
+        Take a token from a bucket.
+
+        :param str key: bucket key.
+        :param int capacity: maximum number of tokens.
+        :param float rate: tokens added per second.
+        :return: seconds to wait for a token, 0 if the token was taken.
+        """
+        return self.take_all([(key, capacity, rate)])
+
+    def take_all(self, buckets):
+        """
+        Take a token from every bucket if none of them is empty.
+
+        :param list buckets: `(key, capacity, rate)` tuples like arguments
+        of `take`.
+        :return: seconds to wait until every bucket has a token, 0 if the
+        tokens were taken.
+        """
+        with self._lock:
+            now = self._timer()
+            taken = {}
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated = self._buckets.get(key, (None, now))
+                tokens, key_wait = take_token(tokens, updated, now, capacity, rate)
+                taken[key] = (tokens, now)
+                wait = max(wait, key_wait)
+            if wait > 0:
+                return wait
+            for key, state in taken.items():
+                self._buckets[key] = state
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        """Refill all buckets."""
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """
+    Buckets in a SQLite file shared by all worker processes of a host.
+
+    Each update reads and writes the buckets of a request in one
+    `BEGIN IMMEDIATE` transaction, which holds the database's write lock, so
+    concurrent requests of different workers never take the same token twice.
+    Buckets which have refilled completely are deleted every `prune_interval`
+    updates.
+    """
+
+    def __init__(self, path, timeout=5, prune_interval=1000, timer=time.time):
+        """
+        :param str path: path to the database file, created if it's missing.
+        :param float timeout: seconds to wait for another process's lock.
+        :param int prune_interval: number of updates between pruning.
+        :param timer: function returning current time in seconds, it must be
+        the same in all processes.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.prune_interval = prune_interval
+        self._timer = timer
+        self._updates = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS bucket ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'full_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None,
+            )
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate):
+        """
+        Take a token from a bucket.
+
+        :param str key: bucket key.
+        :param int capacity: maximum number of tokens.
+        :param float rate: tokens added per second.
+        :return: seconds to wait for a token, 0 if the token was taken.
+        """
+        return self.take_all([(key, capacity, rate)])
+
+    def take_all(self, buckets):
+        """
+        Take a token from every bucket if none of them is empty.
+
+        :param list buckets: `(key, capacity, rate)` tuples like arguments
+        of `take`.
+        :return: seconds to wait until every bucket has a token, 0 if the
+        tokens were taken.
+        """
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = self._timer()
+            rows = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                row = connection.execute(
+                    'SELECT tokens, updated FROM bucket WHERE key = ?', (key,),
+                ).fetchone()
+                tokens, updated = row if row is not None else (None, now)
+                tokens, key_wait = take_token(tokens, updated, now, capacity, rate)
+                rows.append((key, tokens, now, now + (capacity - tokens) / rate))
+                wait = max(wait, key_wait)
+            if wait == 0:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO bucket (key, tokens, updated, full_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    rows,
+                )
+            self._updates += 1
+            if self._updates % self.prune_interval == 0:
+                connection.execute('DELETE FROM bucket WHERE full_at <= ?', (now,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+    def clear(self):
+        """Refill all buckets."""
+        self._connection().execute('DELETE FROM bucket')
+
+
+def _ip_key():
+    return request.remote_addr
+
+
+def _username_key():
+    if request.authorization is not None:
+        return request.authorization.username
+    username = request.form.get('username')
+    if username is None:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            username = data.get('username')
+    return username if isinstance(username, str) else None
+
+
+def _username_ip_key():
+    # Failed logins of one client can't lock the user out from elsewhere
+    username = _username_key()
+    if username is None:
+        return None
+    return '{}@{}'.format(username, request.remote_addr)
+
+
+def _token_key():
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    # Buckets don't need to hold the secret itself
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+# Functions returning the value a limit is counted by in the current request,
+# `None` when the request doesn't have it and the limit doesn't apply
+KEY_FUNCTIONS = {
+    'ip': _ip_key,
+    'username': _username_key,
+    'username_ip': _username_ip_key,
+    'token': _token_key,
+}
+
+
+class RateLimiter:
+    """Checks requests against the limits of their endpoints."""
+
+    def __init__(self, backend, rules):
+        """
+        :param backend: `MemoryBackend` or `SQLiteBackend` object.
+        :param dict rules: a dictionary mapping endpoint, optionally prefixed
+        with a method like `'POST auth.login'`, to a list of limit rules.
+        """
+        self.backend = backend
+        self.limits = {}
+        for endpoint, endpoint_rules in rules.items():
+            method, _, name = endpoint.rpartition(' ')
+            self.limits[(method.upper() or None, name)] = [
+                parse_limit(rule) for rule in endpoint_rules
+            ]
+
+    def check(self):
+        """
+        Take a token for every limit of the current request's endpoint.
+
+        :raise RateLimitExceeded: if a bucket is empty, then no token is
+        taken; its `retry_after` is the number of seconds until the request
+        would be allowed.
+        """
+        limits = self.limits.get((None, request.endpoint), []) + \
+            self.limits.get((request.method, request.endpoint), [])
+        buckets = []
+        for limit in limits:
+            value = KEY_FUNCTIONS[limit.key]()
+            if value is None:
+                continue
+            key = '{}:{}:{}'.format(request.endpoint, limit.key, value)
+            buckets.append((key, limit.capacity, limit.rate))
+        if not buckets:
+            return
+        wait = self.backend.take_all(buckets)
+        if wait > 0:
+            raise RateLimitExceeded(retry_after=math.ceil(wait))
+
+
+def create_rate_limiter(config):
+    """
+    Create `RateLimiter` configured by `RATELIMIT_*` app config values.
+
+    :param dict config: app config.
+    :return: `RateLimiter` object.
+    """
+    storage = config['RATELIMIT_STORAGE']
+    if storage == 'memory':
+        backend = MemoryBackend()
+    elif storage == 'sqlite':
+        backend = SQLiteBackend(config['RATELIMIT_SQLITE_PATH'])
+    else:
+        raise ValueError('Unknown RATELIMIT_STORAGE: {}'.format(storage))
+    return RateLimiter(backend, config['RATELIMIT_RULES'])
+
+
+def init_app(app):
+    """
+    Rate limit requests to endpoints of `RATELIMIT_RULES` if `RATELIMIT_ENABLED`.
+
+    With `RATELIMIT_TRUST_PROXY` set to the number of reverse proxies in
+    front of the app, client IP is taken from `X-Forwarded-For` header.
+    """
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    proxies = app.config['RATELIMIT_TRUST_PROXY']
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies)
+    limiter = create_rate_limiter(app.config)
+    app.extensions['rate_limiter'] = limiter
+    app.before_request(limiter.check)
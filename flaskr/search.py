@@ -0,0 +1,146 @@
+from collections import namedtuple
+
+from sqlalchemy import DDL, and_, case, event, or_, text
+
+from flaskr.db import db
+from flaskr.models import Post
+
+SearchPage = namedtuple('SearchPage', ('items', 'page', 'has_next'))
+
+# SQLite keeps an external-content FTS5 table in sync with `post` by triggers,
+# MySQL maintains FULLTEXT indexes itself. Either way every write to `post`,
+# whatever code issued it, updates the index in the same transaction.
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE post_fts USING fts5("
+    "title, body, content='post', content_rowid='id_')",
+    "CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+    "CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "END",
+    "CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+)
+MYSQL_DDL = 'CREATE FULLTEXT INDEX ix_post_fulltext ON post (title, body)'
+
+for statement in SQLITE_DDL:
+    event.listen(
+        Post.__table__,
+        'after_create',
+        DDL(statement).execute_if(dialect='sqlite'),
+    )
+event.listen(
+    Post.__table__,
+    'before_drop',
+    DDL('DROP TABLE IF EXISTS post_fts').execute_if(dialect='sqlite'),
+)
+event.listen(Post.__table__, 'after_create', DDL(MYSQL_DDL).execute_if(dialect='mysql'))
+
+# Title matches weigh twice as much as body matches
+SQLITE_SEARCH = text(
+    'SELECT rowid FROM post_fts WHERE post_fts MATCH :terms '
+    'ORDER BY bm25(post_fts, 2.0, 1.0), rowid DESC '
+    'LIMIT :limit OFFSET :offset'
+)
+MYSQL_SEARCH = text(
+    'SELECT id_ FROM post '
+    'WHERE MATCH (title, body) AGAINST (:terms IN NATURAL LANGUAGE MODE) '
+    'ORDER BY MATCH (title, body) AGAINST (:terms IN NATURAL LANGUAGE MODE) DESC, '
+    'id_ DESC '
+    'LIMIT :limit OFFSET :offset'
+)
+
+
+def _sqlite_terms(terms):
+    """
+    Turn user input into an FTS5 query matching all the words.
+
+    Every word is quoted, so FTS5 operators and punctuation are searched for
+    literally instead of raising a syntax error.
+    """
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in terms.split())
+
+
+def _like_pattern(word):
+    escaped = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%{}%'.format(escaped)
+
+
+def like_search_ids(terms, limit, offset):
+    """
+    Find IDs of posts containing all the words, for databases without
+    full-text search support.
+
+    It scans the whole table, so it's only a fallback. Posts matching more
+    words in the title come first, then the newest ones.
+
+    :param str terms: words to search for.
+    :param int limit: maximum number of IDs.
+    :param int offset: number of matching posts to skip.
+    :return: a list of post IDs.
+    """
+    patterns = [_like_pattern(word) for word in terms.split()]
+    title_matches = [
+        case([(Post.title.ilike(pattern, escape='\\'), 1)], else_=0)
+        for pattern in patterns
+    ]
+    query = db.session.query(Post.id_).filter(and_(*(
+        or_(
+            Post.title.ilike(pattern, escape='\\'),
+            Post.body.ilike(pattern, escape='\\'),
+        )
+        for pattern in patterns
+    ))).order_by(sum(title_matches).desc(), Post.id_.desc())
+    return [row.id_ for row in query.limit(limit).offset(offset)]
+
+
+def search_post_ids(terms, page, per_page):
+    """
+    Find IDs of posts whose title or body match `terms`, the best match first.
+
+    :param str terms: words to search for.
+    :param int page: 1-based page number.
+    :param int per_page: page size.
+    :return: a tuple of (list of post IDs, bool whether there is a next page).
+    """
+    if not terms.split():
+        return [], False
+    limit, offset = per_page + 1, (page - 1) * per_page
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        statement = SQLITE_SEARCH
+        terms = _sqlite_terms(terms)
+    elif dialect == 'mysql':
+        statement = MYSQL_SEARCH
+    else:
+        ids = like_search_ids(terms, limit, offset)
+        return ids[:per_page], len(ids) > per_page
+    ids = [row[0] for row in db.session.execute(statement, {
+        'terms': terms,
+        'limit': limit,
+        'offset': offset,
+    })]
+    return ids[:per_page], len(ids) > per_page
+
+
+def search_posts(query, terms, page, per_page):
+    """
+    Run full-text search and load matching rows with `query`.
+
+    :param query: SQLAlchemy query selecting posts or rows with `id_` attribute.
+    :param str terms: words to search for.
+    :param int page: 1-based page number.
+    :param int per_page: page size.
+    :return: `SearchPage` object, items are ordered by relevance.
+    """
+    ids, has_next = search_post_ids(terms, page, per_page)
+    if not ids:
+        return SearchPage([], page, False)
+    rows = {row.id_: row for row in query.filter(Post.id_.in_(ids))}
+    items = [rows[id_] for id_ in ids if id_ in rows]
+    return SearchPage(items, page, has_next)
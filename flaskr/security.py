@@ -0,0 +1,90 @@
+import hashlib
+import hmac
+import os
+import threading
+from contextlib import contextmanager
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from flaskr.cache import TTLCache
+
+
+class PasswordHashingBusy(ServiceUnavailable):
+    """Raised when no password hashing slot gets free in time."""
+
+    description = 'Too many login attempts are being processed, please retry later.'
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords with a bounded number of concurrent KDF runs.
+
+    Key derivation is deliberately slow, so a burst of logins could occupy every
+    thread of a worker. At most `max_concurrency` threads of a process hash at
+    the same time, the others wait up to `timeout` seconds for a slot and then
+    get `PasswordHashingBusy`. The limit is per process, which is what keeps
+    the other threads of a worker free, so it needs threaded workers (see
+    gunicorn.conf.py).
+
+    Successful checks are remembered for a short time, so clients repeating
+    Basic auth don't pay for the KDF on every request. Entries are keyed by an
+    HMAC of the stored hash and the password under a per-process random key:
+    the cache never holds passwords, and changing a password changes its
+    stored hash, which makes old entries unreachable.
+    """
+
+    def __init__(self, max_concurrency, timeout, cache_size, cache_ttl):
+        """
+        :param int max_concurrency: number of threads allowed to hash at once.
+        :param float timeout: seconds to wait for a free hashing slot.
+        :param int cache_size: number of remembered successful checks.
+        :param float cache_ttl: seconds a successful check is remembered for.
+        """
+        self.timeout = timeout
+        self.verified = TTLCache(cache_size, cache_ttl)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._key = os.urandom(32)
+
+    def generate(self, password):
+        """
+        Hash a password.
+
+        :param str password: not hashed password.
+        :return: password hash.
+        :raises PasswordHashingBusy: if no hashing slot got free in time.
+        """
+        with self._slot():
+            return generate_password_hash(password)
+
+    def check(self, password_hash, password):
+        """
+        Check that `password` matches `password_hash`.
+
+        :param str password_hash: stored password hash.
+        :param str password: not hashed password.
+        :return: True if the password matches, False otherwise.
+        :raises PasswordHashingBusy: if no hashing slot got free in time.
+        """
+        digest = hmac.new(
+            self._key,
+            '{}\0{}'.format(password_hash, password).encode('utf-8'),
+            hashlib.sha256,
+        ).digest()
+        if self.verified.get(digest):
+            return True
+        with self._slot():
+            matches = check_password_hash(password_hash, password)
+        if matches:
+            self.verified.set(digest, True)
+        return matches
+
+    @contextmanager
+    def _slot(self):
+        """Hold one hashing slot while the block runs."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy(retry_after=1)
+        try:
+            yield
+        finally:
+            self._slots.release()
@@ -0,0 +1,133 @@
+"""
+Synthetic users and posts for load testing and benchmarks.
+
+Rows are generated lazily and inserted with Core executemany in chunks, and
+all users share one password hash computed once, so even tens of millions
+of posts are inserted at the database's bulk insert speed. The same seed
+always produces the same data.
+"""
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func
+
+from flaskr.db import db
+from flaskr.models import Post, User
+
+FIRST_NAMES = (
+    'Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan',
+    'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent',
+    'Victor', 'Walter', 'Zoe',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+    'Davis', 'Wilson', 'Anderson', 'Taylor', 'Thomas', 'Moore', 'Martin',
+    'Lee', 'Walker', 'Hall', 'Young', 'King', 'Wright',
+)
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua flask python sqlite '
+    'mysql cache index query page token login blog post user coffee weekend '
+    'travel music garden release deploy review bug feature idea today'
+).split()
+# Posts per author follow Zipf's law with this exponent: a few users write
+# most of the posts, most users write a few
+ZIPF_EXPONENT = 1.1
+
+
+def _author_cum_weights(rng, users):
+    """Cumulative Zipf weights of users, heavy authors spread over the IDs."""
+    ranks = list(range(1, users + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in ranks))
+
+
+# Titles and body lines are drawn from pools generated up front, which is
+# much faster than making up every sentence word by word
+SENTENCE_POOL_SIZE = 4096
+
+
+def _sentences(rng, min_words, max_words):
+    return [
+        ' '.join(rng.choices(WORDS, k=rng.randint(min_words, max_words))).capitalize()
+        for _ in range(SENTENCE_POOL_SIZE)
+    ]
+
+
+def seed_database(users, posts, seed=0, password_hash='', start=None, days=365,
+                  chunk_size=10000):
+    """
+    Insert synthetic users and posts, one transaction per chunk.
+
+    Users get IDs after the existing ones and usernames `user<ID>`. Posts are
+    spread over `days` days from `start` with exponentially distributed gaps,
+    so their IDs and creation times grow together like on a live blog.
+
+    :param int users: number of users to create.
+    :param int posts: number of posts to create.
+    :param int seed: random seed, the same seed gives the same data.
+    :param str password_hash: password hash shared by all users.
+    :param datetime start: time of the first post, 2020-01-01 by default.
+    :param float days: time span of the posts, must be positive.
+    :param int chunk_size: number of rows inserted in one transaction.
+    :return: a generator of (table name, number of inserted rows) tuples,
+    one per committed chunk.
+    """
+    if posts and not users:
+        raise ValueError('Posts need at least one user')
+    if posts and days <= 0:
+        raise ValueError('Posts need a positive number of days')
+    rng = random.Random(seed)
+    start = start or datetime(2020, 1, 1)
+    first_id = (db.session.query(func.max(User.id_)).scalar() or 0) + 1
+    user_ids = range(first_id, first_id + users)
+
+    for chunk_start in range(0, users, chunk_size):
+        db.session.execute(User.__table__.insert(), [
+            {
+                'id_': id_,
+                'username': 'user{}'.format(id_),
+                'password_hash': password_hash,
+                'first_name': rng.choice(FIRST_NAMES),
+                'last_name': rng.choice(LAST_NAMES),
+                'post_count': 0,
+                'updated': start,
+            }
+            for id_ in user_ids[chunk_start:chunk_start + chunk_size]
+        ])
+        db.session.commit()
+        yield 'user', min(chunk_start + chunk_size, users)
+
+    cum_weights = _author_cum_weights(rng, users) if posts else []
+    titles = _sentences(rng, 2, 8)
+    lines = _sentences(rng, 5, 25)
+    mean_gap = days * 24 * 60 * 60 / posts if posts else 0
+    offset = 0.0
+    # Core inserts bypass `Post` mapper events which maintain the counters, so
+    # they're updated in the transaction of every chunk
+    user_table = User.__table__
+    update = user_table.update().\
+        where(user_table.c.id_ == bindparam('user_id')).\
+        values(post_count=user_table.c.post_count + bindparam('delta'), updated=start)
+    for chunk_start in range(0, posts, chunk_size):
+        count = min(chunk_size, posts - chunk_start)
+        rows = []
+        for author_id in rng.choices(user_ids, cum_weights=cum_weights, k=count):
+            offset += rng.expovariate(1 / mean_gap)
+            created = start + timedelta(seconds=int(offset))
+            rows.append({
+                'author_id': author_id,
+                'created': created,
+                'updated': created,
+                'title': rng.choice(titles),
+                'body': '\n'.join(rng.choices(lines, k=rng.randint(1, 6))),
+            })
+        db.session.execute(Post.__table__.insert(), rows)
+        db.session.execute(update, [
+            {'user_id': author_id, 'delta': delta}
+            for author_id, delta in Counter(row['author_id'] for row in rows).items()
+        ])
+        db.session.commit()
+        yield 'post', chunk_start + count
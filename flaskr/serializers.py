@@ -0,0 +1,222 @@
+"""
+Fast JSON serialization of API collections.
+
+`Post.to_dict` and `User.to_dict` need fully hydrated ORM objects and build a
+dictionary per row which is then encoded as a whole. For collections the API
+instead selects plain column tuples and formats every row straight into a
+JSON string: keys and punctuation of an object are encoded once into a
+template, and each value is converted by a function picked from the column
+type in advance.
+"""
+import json
+from datetime import datetime
+from json.encoder import encode_basestring_ascii
+
+from flask import current_app
+
+from flaskr.db import get_db
+from flaskr.models import Post, User
+from flaskr.pagination import collection_meta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonBackend:
+    """Encoder backend based on the standard library `json` module."""
+
+    name = 'json'
+
+    @staticmethod
+    def encode_string(value):
+        return encode_basestring_ascii(value)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'))
+
+
+class OrjsonBackend:
+    """Encoder backend based on `orjson`, if it's installed."""
+
+    name = 'orjson'
+
+    @staticmethod
+    def encode_string(value):
+        return orjson.dumps(value).decode('utf-8')
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+
+def get_backend(name):
+    """
+    Get JSON encoder backend by its name.
+
+    :param str name: 'json', 'orjson' or 'auto' to use `orjson` if it's
+    installed and `json` otherwise.
+    :return: encoder backend object.
+    :raises ValueError: if backend is unknown or not installed.
+    """
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'json':
+        return JsonBackend()
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError('JSON_ENCODER is orjson, but orjson is not installed')
+        return OrjsonBackend()
+    raise ValueError('Unknown JSON_ENCODER: {}'.format(name))
+
+
+def _converter(column, backend):
+    """Pick a function converting a value of `column` into a JSON literal."""
+    python_type = column.type.python_type
+    if python_type is int:
+        convert = str
+    elif python_type is datetime:
+        # str(datetime) never contains characters which need escaping
+        def convert(value):
+            return '"{}"'.format(value)
+    else:
+        convert = backend.encode_string
+
+    def convert_nullable(value):
+        return 'null' if value is None else convert(value)
+    return convert_nullable
+
+
+class RowSerializer:
+    """
+    Converts rows into JSON objects described by `fields`.
+
+    `fields` is a sequence of (key, column) pairs, where column may also be a
+    nested sequence of pairs for a nested object. Rows must have the columns
+    in the same order as they appear in `fields` (depth first), extra trailing
+    columns are ignored.
+    """
+
+    def __init__(self, fields, backend):
+        self.columns = []
+        # Dotted keys of the columns, e.g. 'author.username'
+        self.keys = []
+        self._converters = []
+        self._template = self._compile(fields, backend)
+
+    def _compile(self, fields, backend, prefix=''):
+        members = []
+        for key, column in fields:
+            if isinstance(column, (tuple, list)):
+                value = self._compile(column, backend, prefix + key + '.')
+            else:
+                self.columns.append(column)
+                self.keys.append(prefix + key)
+                self._converters.append(_converter(column, backend))
+                value = '%s'
+            key = JsonBackend.encode_string(key).replace('%', '%%')
+            members.append('{}:{}'.format(key, value))
+        return '{' + ','.join(members) + '}'
+
+    def __call__(self, row):
+        """
+        Serialize a row.
+
+        :param tuple row: column values.
+        :return: JSON object string.
+        """
+        return self._template % tuple(
+            convert(value) for convert, value in zip(self._converters, row)
+        )
+
+
+POST_FIELDS = (
+    ('id', Post.id_),
+    ('author_id', Post.author_id),
+    ('author', (
+        ('username', User.username),
+        ('first_name', User.first_name),
+        ('last_name', User.last_name),
+    )),
+    ('created', Post.created),
+    ('title', Post.title),
+    ('body', Post.body),
+)
+USER_FIELDS = (
+    ('id', User.id_),
+    ('username', User.username),
+    ('first_name', User.first_name),
+    ('last_name', User.last_name),
+    ('post_count', User.post_count),
+)
+
+
+def init_app(app):
+    """Compile serializers with the encoder backend chosen by `JSON_ENCODER`."""
+    backend = get_backend(app.config['JSON_ENCODER'])
+    app.extensions['serializers'] = {
+        'backend': backend,
+        'post': RowSerializer(POST_FIELDS, backend),
+        'user': RowSerializer(USER_FIELDS, backend),
+    }
+
+
+def get_serializer(name):
+    """Get a serializer compiled for the current app."""
+    return current_app.extensions['serializers'][name]
+
+
+def post_rows():
+    """
+    Query rows for the post serializer.
+
+    Rows end with post's update time, which makes up post's `version` along
+    with the author's fields without loading ORM objects.
+    """
+    return get_db().session.query(
+        *get_serializer('post').columns,
+        Post.updated,
+    ).join(User, Post.author_id == User.id_)
+
+
+def user_rows():
+    """Query rows for the user serializer, ending with user's update time."""
+    return get_db().session.query(*get_serializer('user').columns, User.updated)
+
+
+def post_row_version(row):
+    """Same as `Post.version` for a row of `post_rows`."""
+    return (row.id_, row.updated, row.username, row.first_name, row.last_name)
+
+
+def user_row_version(row):
+    """Same as `User.version` for a row of `user_rows`."""
+    return (row.id_, row.updated)
+
+
+def collection_json(name, page, serializer, endpoint, **kwargs):
+    """
+    Serialize a page of rows into the same document as `to_collection_dict`.
+
+    :param str name: collection key, e.g. 'posts'.
+    :param Page page: page of rows.
+    :param serializer: `RowSerializer` of the rows.
+    :param str endpoint: endpoint name used to build `_links`.
+    :param kwargs: additional arguments for `url_for`.
+    :return: JSON string.
+    """
+    meta = get_serializer('backend').dumps(collection_meta(page, endpoint, **kwargs))
+    # `meta` is a JSON object, its members are appended after the items
+    return '{{{}:[{}],"count":{},{}'.format(
+        JsonBackend.encode_string(name),
+        ','.join(serializer(row) for row in page.items),
+        len(page.items),
+        meta[1:],
+    )
+
+
+def json_response(body):
+    """Wrap a JSON string into a Flask `Response` object."""
+    return current_app.response_class(body, mimetype='application/json')
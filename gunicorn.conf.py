@@ -0,0 +1,15 @@
+import os
+
+from prometheus_client import multiprocess
+
+# Threaded workers: at most PASSWORD_HASH_CONCURRENCY threads of a worker run
+# the password KDF at once, so a burst of logins leaves the other threads free
+# to serve pages. Keep threads below DB_POOL_SIZE + DB_MAX_OVERFLOW
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+
+def child_exit(server, worker):
+    """Drop live gauges of a worker which exited, its counters are kept."""
+    if 'prometheus_multiproc_dir' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
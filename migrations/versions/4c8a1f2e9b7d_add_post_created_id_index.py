@@ -0,0 +1,23 @@
+"""Add (created, id_) index to Post for keyset pagination
+
+Revision ID: 4c8a1f2e9b7d
+Revises: 13a16d8c9963
+Create Date: 2026-10-18 10:02:41.318027
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4c8a1f2e9b7d'
+down_revision = '13a16d8c9963'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # User pages are keyed on the primary key, so only Post needs an index
+    op.create_index('ix_post_created_id_', 'post', ['created', 'id_'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_post_created_id_', table_name='post')
@@ -0,0 +1,34 @@
+"""Add denormalized 'post_count' field to User
+
+Revision ID: 9e5d3b6a0c21
+Revises: 4c8a1f2e9b7d
+Create Date: 2026-10-18 11:15:03.542197
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9e5d3b6a0c21'
+down_revision = '4c8a1f2e9b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column(
+        'post_count',
+        sa.Integer(),
+        nullable=False,
+        server_default='0')
+    )
+    user = sa.table('user', sa.column('id_'), sa.column('post_count'))
+    post = sa.table('post', sa.column('id_'), sa.column('author_id'))
+    post_count = sa.select([sa.func.count(post.c.id_)]).\
+        where(post.c.author_id == user.c.id_).\
+        as_scalar()
+    op.execute(user.update().values(post_count=post_count))
+
+
+def downgrade():
+    op.drop_column('user', 'post_count')
@@ -0,0 +1,31 @@
+"""Replace Post (created, id_) index with a descending one
+
+Revision ID: b3f7c9d2e8a4
+Revises: 9e5d3b6a0c21
+Create Date: 2026-10-18 12:04:19.770315
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7c9d2e8a4'
+down_revision = '9e5d3b6a0c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Both the blog index and /api/posts list the newest posts first
+    op.create_index(
+        'ix_post_created_desc',
+        'post',
+        [sa.text('created DESC'), sa.text('id_ DESC')],
+        unique=False,
+    )
+    op.drop_index('ix_post_created_id_', table_name='post')
+
+
+def downgrade():
+    op.create_index('ix_post_created_id_', 'post', ['created', 'id_'], unique=False)
+    op.drop_index('ix_post_created_desc', table_name='post')
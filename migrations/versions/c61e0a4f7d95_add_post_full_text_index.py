@@ -0,0 +1,63 @@
+"""Add full-text index over Post title and body
+
+Revision ID: c61e0a4f7d95
+Revises: b3f7c9d2e8a4
+Create Date: 2026-10-18 13:27:55.104862
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c61e0a4f7d95'
+down_revision = 'b3f7c9d2e8a4'
+branch_labels = None
+depends_on = None
+
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE post_fts USING fts5("
+    "title, body, content='post', content_rowid='id_')",
+    "CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+    "CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "END",
+    "CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+    # Index the posts which already exist
+    "INSERT INTO post_fts (post_fts) VALUES ('rebuild')",
+)
+SQLITE_DOWNGRADE = (
+    'DROP TRIGGER post_fts_update',
+    'DROP TRIGGER post_fts_delete',
+    'DROP TRIGGER post_fts_insert',
+    'DROP TABLE post_fts',
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.create_index(
+            'ix_post_fulltext',
+            'post',
+            ['title', 'body'],
+            unique=False,
+            mysql_prefix='FULLTEXT',
+        )
+    elif dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ix_post_fulltext', table_name='post')
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
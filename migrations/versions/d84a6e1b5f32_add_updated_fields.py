@@ -0,0 +1,61 @@
+"""Add 'updated' field to User and Post
+
+Revision ID: d84a6e1b5f32
+Revises: c61e0a4f7d95
+Create Date: 2026-10-18 15:42:08.613950
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd84a6e1b5f32'
+down_revision = 'c61e0a4f7d95'
+branch_labels = None
+depends_on = None
+
+# Batch mode recreates the post table on SQLite, which drops the triggers
+# keeping the full-text index of c61e0a4f7d95 in sync
+SQLITE_FTS_TRIGGERS = (
+    "CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+    "CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "END",
+    "CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN "
+    "INSERT INTO post_fts (post_fts, rowid, title, body) "
+    "VALUES ('delete', old.id_, old.title, old.body); "
+    "INSERT INTO post_fts (rowid, title, body) VALUES (new.id_, new.title, new.body); "
+    "END",
+)
+
+
+def _restore_sqlite_fts_triggers():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    op.add_column('post', sa.Column('updated', sa.DateTime(), nullable=True))
+    op.add_column('user', sa.Column('updated', sa.DateTime(), nullable=True))
+    post = sa.table('post', sa.column('created'), sa.column('updated'))
+    user = sa.table('user', sa.column('updated'))
+    op.execute(post.update().values(updated=post.c.created))
+    op.execute(user.update().values(updated=sa.func.now()))
+    # SQLite can't alter columns, batch mode copies the tables there
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.alter_column('updated', existing_type=sa.DateTime(), nullable=False)
+    _restore_sqlite_fts_triggers()
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('updated', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('updated')
+    with op.batch_alter_table('post') as batch_op:
+        batch_op.drop_column('updated')
+    _restore_sqlite_fts_triggers()
@@ -0,0 +1,29 @@
+"""Add Post (author_id, created, id_) index
+
+Revision ID: e5c2a7f19b04
+Revises: d84a6e1b5f32
+Create Date: 2026-10-18 16:41:07.215394
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e5c2a7f19b04'
+down_revision = 'd84a6e1b5f32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Pages of one author's posts, the newest first, are an index range scan
+    op.create_index(
+        'ix_post_author_created_desc',
+        'post',
+        ['author_id', sa.text('created DESC'), sa.text('id_ DESC')],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_post_author_created_desc', table_name='post')
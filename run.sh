@@ -1,5 +1,12 @@
 #!/usr/bin/env sh
 
+# Workers aggregate Prometheus metrics through files in this directory,
+# samples of previous runs must not be counted again
+if [ -n "$prometheus_multiproc_dir" ]; then
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+fi
+
 # Wait till MySQL contaner is ready
 timeout=60
 waited=0
@@ -16,4 +23,4 @@ while [ $waited -lt $timeout ]; do
     sleep $wait_step
 done
 
-exec gunicorn -b :5000 --access-logfile - --error-logfile - 'flaskr:create_app()'
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py -b :5000 --access-logfile - --error-logfile - 'flaskr:create_app()'
\ No newline at end of file
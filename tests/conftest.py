@@ -4,12 +4,20 @@ import tempfile
 from datetime import datetime
 
 import pytest
+from sqlalchemy import event
 
+from config import Config
 from flaskr import create_app
 from flaskr.db import get_db, init_db
 from flaskr.models import Post, User
 
 
+@pytest.fixture(autouse=True)
+def log_file(monkeypatch, tmp_path):
+    """Keep logs of every app created by tests out of the source tree."""
+    monkeypatch.setattr(Config, 'LOG_FILE', str(tmp_path / 'app-logs' / 'flaskr.log'))
+
+
 @pytest.fixture
 def app():
     db_fd, db_path = tempfile.mkstemp()
@@ -39,6 +47,33 @@ def runner(app):
     return app.test_cli_runner()
 
 
+class QueryCounter:
+    """Counts SQL statements sent to the database while active."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def reset(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def query_counter(app):
+    with app.app_context():
+        engine = get_db().engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    yield counter
+    event.remove(engine, 'before_cursor_execute', counter)
+
+
 class AuthActions:
 
     username = 'test'
@@ -1,7 +1,11 @@
+from datetime import datetime, timedelta
+
 import pytest
 from flask import g
 
+from flaskr.db import get_db
 from flaskr.models import Post, User
+from flaskr.pagination import encode_cursor
 
 
 @pytest.mark.parametrize('user_id', ('1', '666', ''))
@@ -174,3 +178,491 @@ def test_get_posts(app, client, auth, user, password, expected_status):
                     continue
                 assert db_post == json_post
         assert json_data['count'] == len(users_posts)
+
+
+def _insert_posts(app, count, author_id=1):
+    with app.app_context():
+        db = get_db()
+        db.session.add_all(
+            Post(
+                author_id=author_id,
+                created=datetime(2020, 3, 1) + timedelta(minutes=i % 5),
+                title='title {}'.format(i),
+                body='body {}'.format(i),
+            ) for i in range(count)
+        )
+        db.session.commit()
+
+
+def test_get_posts_keyset_pagination(app, client, auth):
+    _insert_posts(app, 12)
+    headers = auth.api_login()
+    with app.app_context():
+        expected = [
+            post.id_ for post in
+            Post.query.order_by(Post.created.desc(), Post.id_.desc()).all()
+        ]
+
+    seen = []
+    cursors = []
+    url = '/api/posts?limit=5'
+    while url:
+        json_data = client.get(url, headers=headers).get_json()
+        assert json_data['count'] <= 5
+        seen.extend(post['id'] for post in json_data['posts'])
+        cursors.append(json_data['_meta']['prev_cursor'])
+        url = json_data['_links']['next']
+    assert seen == expected
+    assert cursors[0] is None
+
+    # walking back from the last page gives the previous pages
+    json_data = client.get(
+        '/api/posts?limit=5&cursor={}'.format(cursors[-1]),
+        headers=headers,
+    ).get_json()
+    assert [post['id'] for post in json_data['posts']] == expected[5:10]
+
+
+def test_get_user_posts(app, client, auth):
+    _insert_posts(app, 7, author_id=2)
+    _insert_posts(app, 3)
+    headers = auth.api_login()
+    with app.app_context():
+        expected = [
+            post.to_dict() for post in User.query.get(2).posts.
+            order_by(Post.created.desc(), Post.id_.desc())
+        ]
+    assert len(expected) == 8
+
+    seen = []
+    url = '/api/users/2/posts?limit=3'
+    while url:
+        json_data = client.get(url, headers=headers).get_json()
+        seen.extend(json_data['posts'])
+        url = json_data['_links']['next']
+    assert seen == expected
+
+    json_data = client.get('/api/users/2/posts?stream=1', headers=headers).get_json()
+    assert json_data['posts'] == expected
+
+
+def test_get_user_posts_errors(app, client, auth):
+    headers = auth.api_login()
+    assert client.get('/api/users/99/posts', headers=headers).status_code == 404
+    response = client.get('/api/users/1/posts?cursor=garbage', headers=headers)
+    assert response.status_code == 400
+    assert client.get('/api/users/1/posts').status_code == 401
+
+
+def test_user_posts_use_author_index(app):
+    with app.app_context():
+        plan = get_db().session.execute(
+            'EXPLAIN QUERY PLAN SELECT id_ FROM post WHERE author_id = 1 '
+            'ORDER BY created DESC, id_ DESC LIMIT 10'
+        ).fetchall()
+    assert 'ix_post_author_created_desc' in str(plan)
+    assert 'TEMP B-TREE' not in str(plan)
+
+
+def test_get_users_keyset_pagination(app, client, auth):
+    headers = auth.api_login()
+    first = client.get('/api/users?limit=1', headers=headers).get_json()
+    assert [user['id'] for user in first['users']] == [1]
+    assert first['_meta']['prev_cursor'] is None
+    second = client.get(first['_links']['next'], headers=headers).get_json()
+    assert [user['id'] for user in second['users']] == [2]
+    assert second['_meta']['next_cursor'] is None
+    assert second['_meta']['prev_cursor'] is not None
+
+
+def test_page_size_cap(app, client, auth):
+    app.config['MAX_PAGE_SIZE'] = 3
+    _insert_posts(app, 5)
+    json_data = client.get('/api/posts?limit=1000', headers=auth.api_login()).get_json()
+    assert json_data['count'] == 3
+    assert json_data['_meta']['limit'] == 3
+
+
+@pytest.mark.parametrize('url', ('/api/posts', '/api/users'))
+@pytest.mark.parametrize('cursor', ('garbage', 'eyJkIjoieCJ9', 'e30'))
+def test_invalid_cursor(client, auth, url, cursor):
+    response = client.get(
+        '{}?cursor={}'.format(url, cursor),
+        headers=auth.api_login(),
+    )
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor'
+
+
+@pytest.mark.parametrize('url, keys', (
+    ('/api/users', [1e30]),
+    ('/api/users', [2 ** 64]),
+    ('/api/users', [-2 ** 64]),
+    ('/api/posts', ['2020-01-01T00:00:00', 1e30]),
+))
+def test_cursor_integer_out_of_range(client, auth, url, keys):
+    response = client.get(
+        '{}?cursor={}'.format(url, encode_cursor(keys)),
+        headers=auth.api_login(),
+    )
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor'
+
+
+def test_get_posts_query_count_is_constant(app, client, auth, query_counter):
+    headers = auth.api_login()
+    # warm up the token cache
+    client.get('/api/posts', headers=headers)
+
+    query_counter.reset()
+    response = client.get('/api/posts', headers=headers)
+    assert response.get_json()['count'] == 2
+    small_page_queries = query_counter.count
+
+    with app.app_context():
+        db = get_db()
+        for i in range(8):
+            db.session.add(User(username='author{}'.format(i), password_hash='x'))
+        db.session.commit()
+    for author_id in range(3, 11):
+        _insert_posts(app, 2, author_id=author_id)
+
+    query_counter.reset()
+    response = client.get('/api/posts', headers=headers)
+    assert response.get_json()['count'] == 18
+    assert query_counter.count == small_page_queries
+
+
+def test_token_cache(app, client, auth, query_counter):
+    headers = auth.api_login()
+    cache = app.extensions['token_cache']
+    misses = cache.misses
+
+    client.get('/api/users/1', headers=headers)
+    assert cache.misses == misses + 1
+    query_counter.reset()
+    response = client.get('/api/users/1', headers=headers)
+    assert response.status_code == 200
+    assert cache.hits == 1
+    # only the requested user is loaded
+    assert query_counter.count == 1
+
+
+def test_token_cache_revoke(app, client, auth):
+    headers = auth.api_login()
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    assert len(app.extensions['token_cache']) == 1
+
+    assert auth.api_logout().status_code == 204
+    assert len(app.extensions['token_cache']) == 0
+    assert client.get('/api/users/1', headers=headers).status_code == 401
+
+
+def test_token_cache_evicted_after_commit(app, client, auth):
+    headers = auth.api_login()
+    token = headers['Authorization'].split()[1]
+    cache = app.extensions['token_cache']
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    with app.app_context():
+        db = get_db()
+        user = User.query.get(1)
+        user.revoke_api_token()
+        db.session.flush()
+        # the revocation isn't visible to other requests before the commit
+        assert cache.get(token) is not None
+        db.session.commit()
+        assert cache.get(token) is None
+
+
+def test_token_cache_rollback_keeps_token(app, client, auth):
+    headers = auth.api_login()
+    token = headers['Authorization'].split()[1]
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    with app.app_context():
+        db = get_db()
+        User.query.get(1).revoke_api_token()
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+    assert app.extensions['token_cache'].get(token) is not None
+
+
+def test_token_revoked_by_other_worker(app, client, auth):
+    headers = auth.api_login()
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    with app.app_context():
+        # another worker revokes the token, this worker's cache still holds it
+        db = get_db()
+        db.session.query(User).update(
+            {User.api_token_expiration: datetime.utcnow() - timedelta(seconds=1)},
+        )
+        db.session.commit()
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    response = client.put('/api/users/1', json={'username': 'renamed'}, headers=headers)
+    assert response.status_code == 401
+
+
+def test_token_cache_expiration(app, client, auth):
+    headers = auth.api_login()
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+    with app.app_context():
+        db = get_db()
+        db.session.query(User).update(
+            {User.api_token_expiration: datetime.utcnow() - timedelta(seconds=1)},
+        )
+        db.session.commit()
+    # cached state holds the expiration time, so it doesn't outlive the token
+    app.extensions['token_cache'].set(
+        headers['Authorization'].split()[1],
+        {'api_token_expiration': datetime.utcnow() - timedelta(seconds=1)},
+    )
+    assert client.get('/api/users/1', headers=headers).status_code == 401
+
+
+def test_token_cache_user_update(client, auth):
+    headers = auth.api_login()
+    client.get('/api/users/1', headers=headers)
+    response = client.put('/api/users/1', json={'username': 'renamed'}, headers=headers)
+    assert response.get_json()['username'] == 'renamed'
+    response = client.get('/api/users/1', headers=headers)
+    assert response.get_json()['username'] == 'renamed'
+
+
+@pytest.mark.parametrize(
+    'url',
+    ('/api/posts', '/api/posts/1', '/api/users', '/api/users/1'),
+)
+def test_conditional_get_etag(client, auth, url):
+    headers = auth.api_login()
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get(url, headers=dict(headers, **{'If-None-Match': '"stale"'}))
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', ('/api/posts/1', '/api/users/1'))
+def test_conditional_get_last_modified(client, auth, url):
+    headers = auth.api_login()
+    response = client.get(url, headers=headers)
+    last_modified = response.headers['Last-Modified']
+
+    response = client.get(
+        url,
+        headers=dict(headers, **{'If-Modified-Since': last_modified}),
+    )
+    assert response.status_code == 304
+    response = client.get(
+        url,
+        headers=dict(headers, **{'If-Modified-Since': 'Wed, 01 Jan 2020 00:00:00 GMT'}),
+    )
+    assert response.status_code == 200
+
+
+def test_etag_changes_with_representation(client, auth):
+    headers = auth.api_login()
+    etags = {
+        url: client.get(url, headers=headers).headers['ETag']
+        for url in ('/api/posts', '/api/posts/1', '/api/users')
+    }
+    # renaming the author changes posts' representations as well
+    client.put('/api/users/1', json={'username': 'renamed'}, headers=headers)
+    for url, etag in etags.items():
+        response = client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', ('/api/posts', '/api/users', '/api/users/1/posts'))
+def test_etag_changes_with_links(app, client, auth, url):
+    headers = auth.api_login()
+    count = client.get(url, headers=headers).get_json()['count']
+    url = '{}?limit={}'.format(url, count)
+    response = client.get(url, headers=headers)
+    assert response.get_json()['_links']['next'] is None
+    etag = response.headers['ETag']
+    # rows added after the page's items only add the next page link, Core
+    # inserts don't touch the post counter of the page's author
+    with app.app_context():
+        db = get_db()
+        db.session.execute(
+            User.__table__.insert().values(username='newest', password_hash='x'),
+        )
+        db.session.execute(Post.__table__.insert().values(
+            author_id=1, created=datetime(2000, 1, 1), title='oldest', body='',
+        ))
+        db.session.commit()
+    response = client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.get_json()['_links']['next'] is not None
+
+
+def test_etag_changes_with_post_count(client, auth):
+    headers = auth.api_login()
+    etag = client.get('/api/users/1', headers=headers).headers['ETag']
+    auth.login()
+    client.post('/create', data={'title': 'created', 'body': ''})
+    response = client.get(
+        '/api/users/1',
+        headers=dict(headers, **{'If-None-Match': etag}),
+    )
+    assert response.status_code == 200
+    assert response.get_json()['post_count'] == 2
+
+
+def test_post_etag_ignores_author_post_count(client, auth):
+    headers = auth.api_login()
+    etag = client.get('/api/posts/1', headers=headers).headers['ETag']
+    # the author's post counter changes, the post's representation doesn't
+    response = client.post(
+        '/api/posts/batch',
+        json={'posts': [{'title': 'created'}]},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    response = client.get(
+        '/api/posts/1',
+        headers=dict(headers, **{'If-None-Match': etag}),
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('url, name, model, order_by', (
+    ('/api/posts?stream=1', 'posts', Post, (Post.created.desc(), Post.id_.desc())),
+    ('/api/users?stream=true', 'users', User, (User.id_,)),
+))
+def test_stream_collection(app, client, auth, url, name, model, order_by):
+    app.config['PAGE_SIZE'] = 2
+    app.config['STREAM_CHUNK_SIZE'] = 4
+    _insert_posts(app, 9)
+    response = client.get(url, headers=auth.api_login())
+    assert response.status_code == 200
+    assert response.is_streamed
+    json_data = response.get_json()
+    with app.app_context():
+        expected = [item.to_dict() for item in model.query.order_by(*order_by)]
+    assert json_data[name] == expected
+    assert json_data['count'] == len(expected)
+
+
+def test_stream_empty_collection(app, client, auth):
+    headers = auth.api_login()
+    with app.app_context():
+        db = get_db()
+        for post in Post.query.all():
+            db.session.delete(post)
+        db.session.commit()
+    response = client.get('/api/posts?stream=1', headers=headers)
+    assert response.get_json() == {'posts': [], 'count': 0}
+
+
+def test_create_posts_batch(app, client, auth, query_counter):
+    headers = auth.api_login()
+    batch = [
+        {'title': 'batch {}'.format(i), 'body': 'body {}'.format(i)} for i in range(5)
+    ]
+    batch.append({'title': 'no body'})
+    query_counter.reset()
+    response = client.post(
+        '/api/posts/batch?links=1',
+        json={'posts': batch},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    inserts = [
+        statement for statement in query_counter.statements
+        if statement.startswith('INSERT INTO post ')
+    ]
+    assert len(inserts) == 1
+    json_data = response.get_json()
+    assert json_data['count'] == 6
+    assert [result['id'] for result in json_data['results']] == json_data['ids']
+    assert json_data['results'][0]['location'] == '/api/posts/{}'.format(
+        json_data['ids'][0]
+    )
+    with app.app_context():
+        posts = [Post.query.get(id_) for id_ in json_data['ids']]
+        assert [post.title for post in posts] == [item['title'] for item in batch]
+        assert posts[-1].body == ''
+        assert all(post.author_id == 1 for post in posts)
+        assert User.query.get(1).post_count == 7
+
+
+def test_create_posts_batch_ids_from_insert(app, client, auth):
+    headers = auth.api_login()
+    ids = []
+    for batch in range(2):
+        response = client.post('/api/posts/batch', headers=headers, json={
+            'posts': [{'title': 'batch {} post {}'.format(batch, i)} for i in range(3)],
+        })
+        ids.append(response.get_json()['ids'])
+    with app.app_context():
+        titles = [[Post.query.get(id_).title for id_ in batch] for batch in ids]
+    assert titles == [
+        ['batch {} post {}'.format(batch, i) for i in range(3)] for batch in range(2)
+    ]
+
+
+def test_create_posts_batch_without_links(client, auth):
+    response = client.post(
+        '/api/posts/batch',
+        json={'posts': [{'title': 'title', 'body': 'body'}]},
+        headers=auth.api_login(),
+    )
+    assert response.status_code == 201
+    assert 'location' not in response.get_json()['results'][0]
+
+
+def test_create_posts_batch_invalid(app, client, auth):
+    batch = [
+        {'title': 'valid', 'body': 'body'},
+        {'body': 'body'},
+        {'title': 'x' * 81, 'body': 1},
+        'post',
+    ]
+    response = client.post(
+        '/api/posts/batch',
+        json={'posts': batch},
+        headers=auth.api_login(),
+    )
+    assert response.status_code == 400
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert results[0]['errors'] == []
+    assert results[1]['errors'] == ['Title is required']
+    assert len(results[2]['errors']) == 2
+    assert results[3]['errors'] == ['Post must be a JSON object']
+    with app.app_context():
+        assert Post.query.count() == 2
+
+
+@pytest.mark.parametrize('data', (None, {'posts': []}, {'posts': 'post'}))
+def test_create_posts_batch_empty(client, auth, data):
+    response = client.post('/api/posts/batch', json=data, headers=auth.api_login())
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('data', ([1, 2], 'x', 1))
+def test_create_posts_batch_not_object(client, auth, data):
+    response = client.post('/api/posts/batch', json=data, headers=auth.api_login())
+    assert response.status_code == 400
+
+
+def test_create_posts_batch_too_large(app, client, auth):
+    app.config['API_BATCH_MAX'] = 2
+    response = client.post(
+        '/api/posts/batch',
+        json={'posts': [{'title': 'title'}] * 3},
+        headers=auth.api_login(),
+    )
+    assert response.status_code == 400
+
+
+def test_create_posts_batch_requires_token(client):
+    response = client.post('/api/posts/batch', json={'posts': [{'title': 'title'}]})
+    assert response.status_code == 401
@@ -54,3 +54,47 @@ def test_logout(client, auth):
     with client:
         auth.logout()
         assert 'user_id' not in session
+
+
+def test_user_not_loaded_for_static_files(client, auth, query_counter):
+    auth.login()
+    query_counter.reset()
+    response = client.get('/static/styles.css')
+    assert response.status_code == 200
+    assert query_counter.count == 0
+
+
+def test_user_loaded_once_per_request(client, auth, query_counter):
+    auth.login()
+    query_counter.reset()
+    # both `login_required` and `get_post` check the user
+    response = client.get('/1/update')
+    assert response.status_code == 200
+    user_queries = [
+        statement for statement in query_counter.statements
+        if 'FROM user' in statement
+    ]
+    assert len(user_queries) == 1
+
+
+def test_anonymous_user(client):
+    with client:
+        client.get('/')
+        assert g.user is None
+
+
+def test_user_reloaded_for_every_request_in_app_context(app, client, auth):
+    with app.app_context():
+        auth.login()
+        assert b'Log Out' in client.get('/').data
+        auth.logout()
+        assert b'Log In' in client.get('/').data
+
+
+def test_user_lookups_load_user(client, auth):
+    auth.login()
+    with client:
+        # Static files don't touch `g.user`
+        client.get('/static/styles.css')
+        assert 'user' in g
+        assert g.get('user').username == 'test'
@@ -1,7 +1,10 @@
+import re
+from datetime import datetime
+
 import pytest
 
 from flaskr.db import get_db
-from flaskr.models import Post
+from flaskr.models import Post, User
 
 
 def test_index(client, auth):
@@ -106,3 +109,90 @@ def test_delete(client, auth, app):
 
     with app.app_context():
         assert Post.query.get(1) is None
+
+
+def test_post_count_maintained(client, auth, app):
+    auth.login()
+    client.post('/create', data={'title': 'created', 'body': ''})
+    with app.app_context():
+        assert User.query.get(1).post_count == 2
+    client.post('/1/delete')
+    with app.app_context():
+        assert User.query.get(1).post_count == 1
+
+
+def test_index_pagination(app, client):
+    app.config['POSTS_PER_PAGE'] = 1
+    response = client.get('/')
+    assert b'other title' in response.data
+    assert b'test title' not in response.data
+    assert b'Newer posts' not in response.data
+    assert b'Older posts' in response.data
+
+    older = re.search(rb'href="([^"]+)">Older posts', response.data).group(1)
+    response = client.get(older.decode('utf-8'))
+    assert b'test title' in response.data
+    assert b'other title' not in response.data
+    assert b'Older posts' not in response.data
+
+    newer = re.search(rb'href="([^"]+)">&larr; Newer posts', response.data).group(1)
+    response = client.get(newer.decode('utf-8'))
+    assert b'other title' in response.data
+
+
+def test_index_invalid_cursor(client):
+    response = client.get('/?cursor=garbage')
+    assert response.headers['Location'] == 'http://localhost/'
+
+
+def test_index_fragment_cache(app, client, auth, query_counter):
+    client.get('/')
+    query_counter.reset()
+    response = client.get('/')
+    assert b'test title' in response.data
+    assert query_counter.count == 0
+
+    auth.login()
+    client.post('/create', data={'title': 'fresh post', 'body': ''})
+    auth.logout()
+    assert b'fresh post' in client.get('/').data
+
+
+def test_index_fragment_cache_skips_logged_in_users(app, client, auth):
+    client.get('/')
+    auth.login()
+    # the cached anonymous page has no edit links
+    assert b'href="/1/update"' in client.get('/').data
+
+
+def test_user_posts(app, client):
+    with app.app_context():
+        db = get_db()
+        db.session.add_all(
+            Post(
+                author_id=2,
+                created=datetime(2020, 3, day),
+                title='page title {}'.format(day),
+                body='body',
+            ) for day in range(1, 4)
+        )
+        db.session.commit()
+    app.config['POSTS_PER_PAGE'] = 2
+
+    response = client.get('/user/other')
+    assert response.status_code == 200
+    assert b'Posts by other' in response.data
+    assert b'page title 3' in response.data
+    assert b'page title 2' in response.data
+    assert b'test title' not in response.data
+    next_url = re.search(rb'href="(/user/other\?cursor=[^"]+)"', response.data)
+    response = client.get(next_url.group(1).decode().replace('&amp;', '&'))
+    assert b'page title 1' in response.data
+    assert b'other title' in response.data
+    assert b'page title 3' not in response.data
+
+
+def test_user_posts_not_found(client):
+    assert client.get('/user/nobody').status_code == 404
+    response = client.get('/user/test?cursor=garbage')
+    assert response.headers['Location'].endswith('/user/test')
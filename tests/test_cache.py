@@ -0,0 +1,86 @@
+import pytest
+
+from flaskr.cache import FileSystemCache, FragmentCache, TTLCache
+
+
+class FakeTimer:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expiration():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=1)
+    timer.now = 2
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    timer.now = 5
+    assert cache.get('a') is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'size': 0}
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_filesystem_cache(tmp_path):
+    cache = FileSystemCache(str(tmp_path), ttl=60)
+    cache.set('a', 'first\nsecond')
+    assert cache.get('a') == 'first\nsecond'
+    # another process sees the same entries
+    assert FileSystemCache(str(tmp_path), ttl=60).get('a') == 'first\nsecond'
+    cache.delete('a')
+    assert cache.get('a') is None
+    cache.set('b', 'expired', ttl=-1)
+    assert cache.get('b') is None
+
+
+def test_filesystem_cache_threshold(tmp_path):
+    cache = FileSystemCache(str(tmp_path), ttl=60, threshold=3)
+    for i in range(10):
+        cache.set(str(i), str(i), ttl=60 + i)
+    assert len(cache) == 3
+    assert cache.get('9') == '9'
+
+
+@pytest.mark.parametrize('make_backend', (
+    lambda tmp_path: TTLCache(maxsize=10, ttl=60),
+    lambda tmp_path: FileSystemCache(str(tmp_path), ttl=60),
+))
+def test_fragment_cache_invalidation(tmp_path, make_backend):
+    backend = make_backend(tmp_path)
+    cache = FragmentCache(backend)
+    other_process = FragmentCache(backend)
+    cache.set('page', '<p>old</p>', cache.generation())
+    assert other_process.get('page', other_process.generation()) == '<p>old</p>'
+    other_process.invalidate()
+    assert cache.get('page', cache.generation()) is None
+
+
+def test_fragment_cache_concurrent_invalidation():
+    cache = FragmentCache(TTLCache(maxsize=10, ttl=60))
+    generation = cache.generation()
+    assert cache.get('page', generation) is None
+    # A post changes while the page is being rendered from the old data
+    cache.invalidate()
+    cache.set('page', '<p>stale</p>', generation)
+    assert cache.get('page', cache.generation()) is None
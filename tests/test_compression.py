@@ -0,0 +1,108 @@
+import gzip
+import os
+
+from flaskr import compression
+from flaskr.compression import compress_static
+
+from test_api import _insert_posts
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_compress_large_response(app, client, auth):
+    _insert_posts(app, 20)
+    headers = auth.api_login()
+    plain = client.get('/api/posts', headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    response = client.get('/api/posts', headers=dict(headers, **GZIP))
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert int(response.headers['Content-Length']) < len(plain.get_data())
+
+
+def test_compressed_response_has_weak_etag(app, client, auth):
+    _insert_posts(app, 20)
+    headers = dict(auth.api_login(), **GZIP)
+    response = client.get('/api/posts', headers=headers)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    response = client.get('/api/posts', headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_not_modified_response_has_weak_etag(client, auth):
+    headers = dict(auth.api_login(), **GZIP)
+    # Too small to compress, the validator is the same as of compressed bodies
+    response = client.get('/api/users/1', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get(
+        '/api/users/1',
+        headers=dict(headers, **{'If-None-Match': etag}),
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_small_response_not_compressed(client, auth):
+    headers = dict(auth.api_login(), **GZIP)
+    response = client.get('/api/users/1', headers=headers)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_response_not_compressed(app, client, auth):
+    _insert_posts(app, 20)
+    headers = dict(auth.api_login(), **GZIP)
+    response = client.get('/api/posts?stream=1', headers=headers)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['count'] == 22
+
+
+def test_compression_disabled(app, client, auth):
+    _insert_posts(app, 20)
+    app.config['COMPRESS_ENABLED'] = False
+    headers = dict(auth.api_login(), **GZIP)
+    response = client.get('/api/posts', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_serve_precompressed_static(app, client, runner, tmp_path, monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    with open(os.path.join(app.static_folder, 'styles.css'), 'rb') as css_file:
+        css = css_file.read()
+    (tmp_path / 'styles.css').write_bytes(css)
+    app.static_folder = str(tmp_path)
+
+    response = client.get('/static/styles.css', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    response.close()
+
+    result = runner.invoke(args=['compress-static'])
+    assert '1 compressed files written' in result.output
+    assert gzip.decompress((tmp_path / 'styles.css.gz').read_bytes()) == css
+
+    response = client.get('/static/styles.css', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.get_data()) == css
+    response.close()
+
+    response = client.get('/static/styles.css')
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == css
+    response.close()
+
+
+def test_compress_static_skips_incompressible(tmp_path):
+    (tmp_path / 'tiny.css').write_bytes(b'a{}')
+    (tmp_path / 'image.png').write_bytes(b'\x89PNG' * 100)
+    assert compress_static(str(tmp_path), ('.css', '.js')) == []
@@ -1,4 +1,18 @@
-from flaskr.db import get_db
+import csv
+import gzip
+import json
+import logging
+import re
+
+import pytest
+from sqlalchemy import event
+
+from flaskr import create_app
+from flaskr.db import get_db, normalize_statement
+from flaskr.models import Post, User
+from flaskr.seed import seed_database
+
+from conftest import AuthActions, QueryCounter
 
 
 def test_get_close_db(app):
@@ -20,3 +34,289 @@ def test_init_db_command(runner, monkeypatch):
     result = runner.invoke(args=['init-db'])
     assert 'Database is initialized' in result.output
     assert Recorder.called
+
+
+def test_rebuild_post_counts_command(app, runner):
+    with app.app_context():
+        db = get_db()
+        db.session.query(User).update({User.post_count: 42})
+        db.session.commit()
+
+    result = runner.invoke(args=['rebuild-post-counts'])
+    assert 'Post counters are rebuilt' in result.output
+    with app.app_context():
+        assert [user.post_count for user in User.query.order_by(User.id_)] == [1, 1]
+
+
+def _write_lines(path, items):
+    path.write_text(''.join(json.dumps(item) + '\n' for item in items))
+    return str(path)
+
+
+def test_import_users_command(app, runner, tmp_path):
+    path = _write_lines(tmp_path / 'users.jsonl', [
+        {'username': 'imported{}'.format(i), 'password_hash': 'hash{}'.format(i)}
+        for i in range(5)
+    ] + [{'username': 'plain', 'password': 'secret', 'first_name': 'Plain'}])
+
+    result = runner.invoke(args=['import', 'users', path, '--chunk-size', '4'])
+    assert result.exit_code == 0
+    assert 'line 4: 4 rows imported' in result.output
+    assert 'Imported 6 rows' in result.output
+    with app.app_context():
+        assert User.query.filter_by(username='imported3').one().password_hash == 'hash3'
+        plain = User.query.filter_by(username='plain').one()
+        assert plain.first_name == 'Plain'
+        assert plain.check_password('secret')
+
+
+def test_import_users_command_resume(app, runner, tmp_path):
+    items = [
+        {'username': 'imported{}'.format(i), 'password_hash': 'hash'} for i in range(6)
+    ]
+    items[3]['username'] = 'test'
+    path = _write_lines(tmp_path / 'users.jsonl', items)
+
+    result = runner.invoke(args=['import', 'users', path, '--chunk-size', '2'])
+    assert result.exit_code == 1
+    assert 'Chunk starting at line 3 failed' in result.output
+    assert '--start-line 3' in result.output
+    with app.app_context():
+        assert User.query.count() == 4
+
+    items[3]['username'] = 'imported3'
+    _write_lines(tmp_path / 'users.jsonl', items)
+    result = runner.invoke(args=['import', 'users', path, '--start-line', '3'])
+    assert result.exit_code == 0
+    assert 'Imported 4 rows' in result.output
+    with app.app_context():
+        assert User.query.count() == 8
+
+
+def test_import_posts_command(app, runner, tmp_path):
+    path = _write_lines(tmp_path / 'posts.jsonl', [
+        {'author': 'other', 'title': 'by name', 'created': '2021-01-01T10:00:00'},
+        {'author_id': 1, 'title': 'by id', 'body': 'body'},
+    ])
+    result = runner.invoke(args=['import', 'posts', path])
+    assert result.exit_code == 0
+    with app.app_context():
+        post = Post.query.filter_by(title='by name').one()
+        assert post.author.username == 'other'
+        assert str(post.created) == '2021-01-01 10:00:00'
+        assert [user.post_count for user in User.query.order_by(User.id_)] == [2, 2]
+
+
+def test_import_posts_command_invalid_line(app, runner, tmp_path):
+    path = tmp_path / 'posts.jsonl'
+    path.write_text('{"author_id": 1, "title": "valid"}\nnot json\n')
+    result = runner.invoke(args=['import', 'posts', str(path)])
+    assert result.exit_code == 1
+    assert 'line 2' in result.output
+    with app.app_context():
+        assert Post.query.count() == 2
+
+
+@pytest.mark.parametrize('author', (
+    {'author_id': 99}, {'author_id': '1'}, {'author_id': True}, {'author': 'nobody'},
+    {'author': ['test']}, {},
+))
+def test_import_posts_command_unknown_author(app, runner, tmp_path, author):
+    path = _write_lines(tmp_path / 'posts.jsonl', [
+        {'author_id': 1, 'title': 'valid'},
+        dict(author, title='invalid'),
+    ])
+    result = runner.invoke(args=['import', 'posts', path])
+    assert result.exit_code == 1
+    assert 'line 2: unknown author' in result.output
+    with app.app_context():
+        assert Post.query.count() == 2
+
+
+def test_import_posts_command_failure_invalidates_cache(app, runner, tmp_path):
+    path = _write_lines(tmp_path / 'posts.jsonl', [
+        {'author_id': 1, 'title': 'first chunk'},
+        {'author_id': 99, 'title': 'second chunk'},
+    ])
+    cache = app.extensions['fragment_cache']
+    generation = cache.generation()
+    result = runner.invoke(args=['import', 'posts', path, '--chunk-size', '1'])
+    assert result.exit_code == 1
+    assert cache.generation() != generation
+
+
+def test_export_posts_command_jsonl(app, runner):
+    result = runner.invoke(args=['export', 'posts'])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[-1].startswith('Exported 2 rows')
+    with app.app_context():
+        expected = [post.to_dict() for post in Post.query.order_by(Post.created)]
+    assert [json.loads(line) for line in lines[:-1]] == expected
+
+
+def test_export_posts_command_since(runner):
+    result = runner.invoke(args=['export', 'posts', '--since', '2020-01-15'])
+    lines = result.output.splitlines()
+    assert [json.loads(line)['title'] for line in lines[:-1]] == ['other title']
+
+
+def test_export_users_command_csv_gzip(app, runner, tmp_path):
+    path = tmp_path / 'users.csv.gz'
+    result = runner.invoke(
+        args=['export', 'users', '--format', 'csv', '--gzip', '-o', str(path)],
+    )
+    assert result.exit_code == 0
+    with gzip.open(str(path), 'rt', encoding='utf-8', newline='') as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == ['id', 'username', 'first_name', 'last_name', 'post_count']
+    assert rows[1] == ['1', 'test', 'TestUserFirstName', 'TestUserLastName', '1']
+    assert len(rows) == 3
+
+
+def _server_timing(response):
+    match = re.match(
+        r'db;dur=([\d.]+);desc="(\d+) queries", total;dur=([\d.]+)$',
+        response.headers['Server-Timing'],
+    )
+    assert match is not None
+    return float(match.group(1)), int(match.group(2)), float(match.group(3))
+
+
+@pytest.fixture
+def timed_app(app):
+    return create_app(dict(app.config, SERVER_TIMING=True))
+
+
+def test_server_timing(timed_app):
+    client = timed_app.test_client()
+    headers = AuthActions(client).api_login()
+    counter = QueryCounter()
+    with timed_app.app_context():
+        engine = get_db().engine
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        response = client.get('/api/posts', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+    db_time, count, total = _server_timing(response)
+    assert count == counter.count > 0
+    assert 0 < db_time <= total
+
+
+def test_server_timing_without_queries(timed_app):
+    _, count, _ = _server_timing(timed_app.test_client().get('/auth/login'))
+    assert count == 0
+
+
+def test_server_timing_disabled_by_default(client):
+    assert 'Server-Timing' not in client.get('/auth/login').headers
+
+
+def test_slow_query_log(app, client, auth, caplog):
+    headers = auth.api_login()
+    app.config['SLOW_QUERY_TIME'] = 1e-9
+    with caplog.at_level(logging.WARNING, logger='flaskr.sql'):
+        client.get('/api/posts/1', headers=headers)
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages
+    assert all(' in api.get_post: SELECT ' in message for message in messages)
+    assert any('WHERE post.id_ = ?' in message for message in messages)
+
+
+def test_slow_query_log_disabled(app, client, auth, caplog):
+    headers = auth.api_login()
+    app.config['SLOW_QUERY_TIME'] = 0
+    with caplog.at_level(logging.WARNING, logger='flaskr.sql'):
+        client.get('/api/posts/1', headers=headers)
+    assert not caplog.records
+
+
+@pytest.mark.parametrize('statement, normalized', (
+    (
+        'SELECT * FROM post\nWHERE id_ IN (?, ?, ?)  AND title = ?',
+        'SELECT * FROM post WHERE id_ IN (...) AND title = ?',
+    ),
+    (
+        "SELECT anon_1 FROM user WHERE username = 'it''s' LIMIT 10",
+        'SELECT anon_1 FROM user WHERE username = ? LIMIT ?',
+    ),
+    (
+        'UPDATE user SET post_count=(user.post_count + %(post_count_1)s) WHERE id_ = %s',
+        'UPDATE user SET post_count=(user.post_count + ?) WHERE id_ = ?',
+    ),
+))
+def test_normalize_statement(statement, normalized):
+    assert normalize_statement(statement) == normalized
+
+
+def _seeded_rows(app):
+    with app.app_context():
+        users = [
+            (user.id_, user.username, user.first_name, user.post_count)
+            for user in User.query.order_by(User.id_)
+        ]
+        posts = [
+            (post.author_id, post.created, post.title, post.body)
+            for post in Post.query.order_by(Post.id_)
+        ]
+    return users, posts
+
+
+def test_seed_command(app, runner):
+    result = runner.invoke(args=[
+        'seed', '--users', '20', '--posts', '300', '--seed', '7', '--chunk-size', '100',
+    ])
+    assert result.exit_code == 0
+    assert 'post: 300 rows inserted' in result.output
+    users, posts = _seeded_rows(app)
+    assert len(users) == 22
+    assert len(posts) == 302
+    # New users come after the existing ones and counters match their posts
+    assert users[2][:2] == (3, 'user3')
+    for user_id, _, _, post_count in users:
+        assert post_count == sum(1 for post in posts if post[0] == user_id)
+    # Posts are ordered in time like on a live blog, a few authors write most
+    seeded = posts[2:]
+    assert [post[1] for post in seeded] == sorted(post[1] for post in seeded)
+    assert max(user[3] for user in users) > 3 * 300 / 20
+    with app.app_context():
+        assert User.query.get(3).check_password('password')
+
+
+def test_seed_command_is_deterministic(app, runner):
+    args = ['seed', '--users', '5', '--posts', '50', '--seed', '3']
+    runner.invoke(args=args)
+    first = _seeded_rows(app)
+    with app.app_context():
+        db = get_db()
+        Post.query.filter(Post.author_id > 2).delete()
+        User.query.filter(User.id_ > 2).delete()
+        db.session.commit()
+    runner.invoke(args=args)
+    assert _seeded_rows(app) == first
+
+
+def test_seed_command_posts_without_users(runner):
+    result = runner.invoke(args=['seed', '--users', '0', '--posts', '10'])
+    assert result.exit_code == 1
+    assert 'Posts need at least one user' in result.output
+
+
+def test_seed_command_needs_positive_days(runner):
+    result = runner.invoke(args=['seed', '--users', '1', '--posts', '10', '--days', '0'])
+    assert result.exit_code == 1
+    assert 'Posts need a positive number of days' in result.output
+
+
+def test_seed_interrupted_keeps_counters(app):
+    with app.app_context():
+        progress = seed_database(5, 100, chunk_size=30)
+        for table, inserted in progress:
+            if table == 'post':
+                break
+        progress.close()
+    users, posts = _seeded_rows(app)
+    assert len(posts) == 32
+    for user_id, _, _, post_count in users:
+        assert post_count == sum(1 for post in posts if post[0] == user_id)
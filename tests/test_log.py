@@ -0,0 +1,104 @@
+import json
+import logging
+
+import pytest
+
+from flaskr import create_app
+from flaskr.log import AppQueueHandler, JsonFormatter, RequestContextFilter
+
+
+def queue_handlers(app):
+    return [h for h in app.logger.handlers if isinstance(h, AppQueueHandler)]
+
+
+def read_log(app, path):
+    # Stopping the listener writes out all queued records
+    queue_handlers(app)[0].listener.stop()
+    with open(path, encoding='utf-8') as log_file:
+        return log_file.read().splitlines()
+
+
+@pytest.fixture
+def json_log_app(app, tmp_path):
+    log_path = str(tmp_path / 'logs' / 'flaskr.log')
+    app = create_app(dict(
+        app.config,
+        LOG_FILE=log_path,
+        LOG_FORMAT='json',
+    ))
+    app.log_path = log_path
+    return app
+
+
+def test_one_queue_handler(app):
+    create_app(dict(app.config))
+    assert len(queue_handlers(app)) == 1
+
+
+def test_text_format(app, tmp_path):
+    log_path = str(tmp_path / 'flaskr.log')
+    app = create_app(dict(app.config, LOG_FILE=log_path))
+    app.logger.warning('disk %s full', 'almost')
+    lines = read_log(app, log_path)
+    assert 'INFO: Flaskr startup [in ' in lines[0]
+    assert 'WARNING: disk almost full' in lines[1]
+
+
+def test_json_format_in_request(json_log_app):
+    app = json_log_app
+
+    @app.route('/log-test')
+    def log_test():
+        app.logger.info('handling %d', 1)
+        return 'ok'
+
+    response = app.test_client().get('/log-test', headers={'X-Request-ID': 'abc123'})
+    assert response.headers['X-Request-ID'] == 'abc123'
+    entry = json.loads(read_log(app, app.log_path)[-1])
+    assert entry['message'] == 'handling 1'
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'abc123'
+    assert entry['endpoint'] == 'log_test'
+    assert entry['method'] == 'GET'
+    assert entry['path'] == '/log-test'
+
+
+def test_json_format_exception(json_log_app):
+    app = json_log_app
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        app.logger.exception('failed')
+    entry = json.loads(read_log(app, app.log_path)[-1])
+    assert entry['message'] == 'failed'
+    assert 'request_id' not in entry
+    assert 'ZeroDivisionError' in entry['exception']
+
+
+def test_request_id_generated(client):
+    first = client.get('/').headers['X-Request-ID']
+    second = client.get('/').headers['X-Request-ID']
+    assert first and second and first != second
+
+
+def test_full_queue_drops_records(app, tmp_path):
+    app = create_app(dict(
+        app.config,
+        LOG_FILE=str(tmp_path / 'flaskr.log'),
+        LOG_QUEUE_SIZE=2,
+    ))
+    handler = queue_handlers(app)[0]
+    handler.listener.stop()
+    for _ in range(5):
+        app.logger.info('message')
+    assert handler.dropped == 3
+
+
+def test_request_context_filter(app):
+    record = logging.LogRecord('flaskr', logging.INFO, __file__, 1, 'msg', None, None)
+    with app.test_request_context('/auth/login', headers={'X-Request-ID': 'x'}):
+        app.preprocess_request()
+        RequestContextFilter().filter(record)
+    assert record.request_id == 'x'
+    assert record.path == '/auth/login'
+    assert json.loads(JsonFormatter().format(record))['request_id'] == 'x'
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from flaskr import create_app
+
+SAMPLE = (
+    'flaskr_http_requests_total'
+    '{{endpoint="{}",method="GET",status="{}"}}'
+)
+
+
+def _sample_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.split()[-1])
+    return None
+
+
+def test_metrics(client, auth):
+    headers = auth.api_login()
+    before = client.get('/metrics').get_data(as_text=True)
+    client.get('/api/posts', headers=headers)
+    client.get('/api/posts/666', headers=headers)
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    for endpoint, status in (('api.get_all_posts', 200), ('api.get_post', 404)):
+        sample = SAMPLE.format(endpoint, status)
+        assert _sample_value(text, sample) == (_sample_value(before, sample) or 0) + 1
+    assert 'flaskr_http_request_duration_seconds_bucket{' \
+        'endpoint="api.get_all_posts",le="0.005",method="GET",status="200"}' in text
+    # Only the request serving the metrics is in progress
+    assert _sample_value(text, 'flaskr_http_requests_in_progress') == 1
+
+
+def test_metrics_disabled():
+    app = create_app({'TESTING': True, 'METRICS_ENABLED': False})
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+WORKER = textwrap.dedent('''
+    import sys
+    from flaskr import create_app
+
+    client = create_app({'TESTING': True}).test_client()
+    for _ in range(int(sys.argv[1])):
+        client.get('/auth/login')
+    if len(sys.argv) > 2:
+        sys.stdout.write(client.get('/metrics').get_data(as_text=True))
+''')
+
+
+def test_metrics_aggregate_worker_processes(tmp_path):
+    env = dict(
+        os.environ,
+        prometheus_multiproc_dir=str(tmp_path / 'metrics'),
+        LOG_FILE=str(tmp_path / 'logs' / 'flaskr.log'),
+    )
+    os.mkdir(env['prometheus_multiproc_dir'])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run_worker(*args):
+        return subprocess.run(
+            [sys.executable, '-c', WORKER] + list(args),
+            cwd=root,
+            env=env,
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+
+    run_worker('2')
+    run_worker('3')
+    text = run_worker('1', 'scrape')
+    assert _sample_value(text, SAMPLE.format('auth.login', 200)) == 6
@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import exc
+
+from flaskr import create_app
+from flaskr.db import get_db, init_db
+from flaskr.pool import InstrumentedQueuePool, PoolMetrics, engine_options, pool_status
+
+
+@pytest.fixture
+def pooled_app():
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': 1,
+            'max_overflow': 0,
+            'pool_timeout': 0.1,
+        },
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+def test_engine_options_mysql(app):
+    options = engine_options(dict(
+        app.config,
+        SQLALCHEMY_DATABASE_URI='mysql+pymysql://user:password@db/flaskr',
+        DB_POOL_SIZE=3,
+        DB_POOL_RECYCLE=280,
+    ))
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['pool_size'] == 3
+    assert options['max_overflow'] == app.config['DB_MAX_OVERFLOW']
+    assert options['pool_recycle'] == 280
+    assert options['pool_pre_ping'] is True
+
+
+def test_engine_options_sqlite(app):
+    assert engine_options(app.config) == {}
+
+
+def test_explicit_engine_options_win():
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'mysql+pymysql://user:password@db/flaskr',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 42},
+    })
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 42
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'] is InstrumentedQueuePool
+
+
+def test_pool_status(pooled_app):
+    client = pooled_app.test_client()
+    client.get('/')
+    client.get('/')
+    with pooled_app.app_context():
+        engine = get_db().engine
+        status = pool_status(engine)
+        assert status['size'] == 1
+        assert status['checked_out'] == 0
+        assert status['checkouts'] >= 2
+        assert status['peak_checked_out'] == 1
+        assert status['latency_max'] >= status['latency_p50'] >= 0
+
+        with engine.connect():
+            assert pool_status(engine)['utilization'] == 1
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        assert pool_status(engine)['timeouts'] == 1
+
+
+def test_pool_status_not_queue_pool(app):
+    with app.app_context():
+        assert pool_status(get_db().engine) is None
+
+
+def test_pool_metrics_percentiles():
+    metrics = PoolMetrics()
+    assert metrics.percentile(95) == 0
+    for latency in range(1, 101):
+        metrics.observe_checkout(latency / 1000, 1)
+    assert metrics.percentile(50) == 0.051
+    assert metrics.percentile(99) == 0.1
+    assert metrics.stats()['slow_checkouts'] == 1
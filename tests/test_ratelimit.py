@@ -0,0 +1,238 @@
+import base64
+import os
+import tempfile
+import threading
+
+import pytest
+
+from flaskr import create_app
+from flaskr.ratelimit import (
+    Limit,
+    MemoryBackend,
+    SQLiteBackend,
+    parse_limit,
+    take_token,
+)
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def basic_auth_header(username, password):
+    credentials = base64.b64encode('{}:{}'.format(username, password).encode())
+    return {'Authorization': 'Basic ' + credentials.decode()}
+
+
+@pytest.mark.parametrize(('rule', 'limit'), (
+    ('5/minute per ip', Limit(5, 5 / 60, 'ip')),
+    ('10 / seconds per token', Limit(10, 10, 'token')),
+    ('1/day per username', Limit(1, 1 / 86400, 'username')),
+    ('3/hour per username_ip', Limit(3, 3 / 3600, 'username_ip')),
+))
+def test_parse_limit(rule, limit):
+    assert parse_limit(rule) == limit
+
+
+@pytest.mark.parametrize('rule', (
+    '5 per ip', '5/fortnight per ip', '5/minute per cookie', 'x/minute per ip',
+))
+def test_parse_limit_invalid(rule):
+    with pytest.raises(ValueError):
+        parse_limit(rule)
+
+
+def test_take_token():
+    assert take_token(None, 0, 0, 2, 1) == (1, 0)
+    assert take_token(0, 0, 0.25, 2, 1) == (0.25, 0.75)
+    assert take_token(0, 0, 10, 2, 1) == (1, 0)
+
+
+@pytest.fixture(params=('memory', 'sqlite'))
+def backend(request, tmp_path):
+    timer = FakeTimer()
+    if request.param == 'memory':
+        backend = MemoryBackend(timer=timer)
+    else:
+        backend = SQLiteBackend(str(tmp_path / 'ratelimit.sqlite'), timer=timer)
+    backend.timer = timer
+    return backend
+
+
+def test_backend_bucket(backend):
+    assert backend.take('a', 2, 1) == 0
+    assert backend.take('a', 2, 1) == 0
+    assert backend.take('a', 2, 1) == pytest.approx(1)
+    # Buckets are independent
+    assert backend.take('b', 2, 1) == 0
+    backend.timer.now += 1.5
+    assert backend.take('a', 2, 1) == 0
+    backend.clear()
+    assert backend.take('a', 2, 1) == 0
+
+
+def test_backend_take_all(backend):
+    assert backend.take_all([('a', 1, 1), ('b', 2, 1)]) == 0
+    # 'a' is empty, so no token is taken from 'b'
+    assert backend.take_all([('a', 1, 1), ('b', 2, 1)]) == pytest.approx(1)
+    assert backend.take('b', 2, 1) == 0
+    assert backend.take('b', 2, 1) > 0
+    backend.timer.now += 1
+    assert backend.take_all([('a', 1, 1), ('b', 2, 1)]) == 0
+
+
+def test_memory_backend_maxsize():
+    backend = MemoryBackend(maxsize=1)
+    backend.take('a', 1, 1)
+    backend.take('b', 1, 1)
+    # Bucket 'a' was evicted, so it's full again
+    assert backend.take('a', 1, 1) == 0
+
+
+def test_sqlite_backend_shared(tmp_path):
+    path = str(tmp_path / 'ratelimit.sqlite')
+    backends = [SQLiteBackend(path) for _ in range(2)]
+    waits = []
+
+    def take(backend):
+        for _ in range(10):
+            waits.append(backend.take('key', 10, 0.001))
+
+    threads = [threading.Thread(target=take, args=(b,)) for b in backends]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert waits.count(0) == 10
+
+
+def test_sqlite_backend_prunes_full_buckets(tmp_path):
+    timer = FakeTimer()
+    backend = SQLiteBackend(str(tmp_path / 'rl.sqlite'), prune_interval=2, timer=timer)
+    backend.take('a', 1, 1)
+    timer.now += 10
+    backend.take('b', 1, 1)
+    keys = backend._connection().execute('SELECT key FROM bucket').fetchall()
+    assert keys == [('b',)]
+
+
+@pytest.fixture
+def limited_app(app):
+    return create_app(dict(app.config, RATELIMIT_RULES={
+        'api.get_token': ['4/minute per ip', '2/minute per username'],
+        'POST auth.login': ['2/minute per ip'],
+        'api.get_all_users': ['1/minute per token'],
+    }))
+
+
+def test_rate_limit_api(limited_app):
+    client = limited_app.test_client()
+    statuses = [
+        client.post('/api/tokens', headers=basic_auth_header('test', 'test')).status_code
+        for _ in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+    # The rejected request didn't take a token from the per IP bucket
+    for username in ('other', 'another'):
+        response = client.post('/api/tokens', headers=basic_auth_header(username, 'x'))
+        assert response.status_code == 401
+    # The per IP limit is exhausted for any username
+    response = client.post('/api/tokens', headers=basic_auth_header('third', 'test'))
+    assert response.status_code == 429
+    assert response.get_json()['error'] == 'Too Many Requests'
+    assert 1 <= int(response.headers['Retry-After']) <= 60
+
+
+def test_rate_limit_token(limited_app):
+    client = limited_app.test_client()
+    token = client.post('/api/tokens', headers=basic_auth_header('test', 'test'))\
+        .get_json()['token']
+    headers = {'Authorization': 'Bearer ' + token}
+    assert client.get('/api/users', headers=headers).status_code == 200
+    assert client.get('/api/users', headers=headers).status_code == 429
+    # Requests without a token aren't counted by the per token limit
+    assert client.get('/api/users').status_code == 401
+
+
+def test_rate_limit_login_post_only(limited_app):
+    client = limited_app.test_client()
+    for _ in range(2):
+        client.post('/auth/login', data={'username': 'a', 'password': 'b'})
+    response = client.post(
+        '/auth/login',
+        data={'username': 'a', 'password': 'b'},
+        headers={'Accept': 'text/html'},
+    )
+    assert response.status_code == 429
+    assert b'Too many requests' in response.data
+    assert 'Retry-After' in response.headers
+    assert client.get('/auth/login').status_code == 200
+
+
+def test_rate_limit_username_per_ip(app):
+    app = create_app(dict(app.config, RATELIMIT_RULES={
+        'POST auth.login': ['1/minute per username_ip'],
+    }))
+    client = app.test_client()
+    data = {'username': 'test', 'password': 'wrong'}
+    attacker = {'REMOTE_ADDR': '10.0.0.1'}
+    assert client.post('/auth/login', data=data, environ_base=attacker)\
+        .status_code == 200
+    assert client.post('/auth/login', data=data, environ_base=attacker)\
+        .status_code == 429
+    # Failed logins from another address don't lock the user out
+    response = client.post(
+        '/auth/login',
+        data={'username': 'test', 'password': 'test'},
+        environ_base={'REMOTE_ADDR': '10.0.0.2'},
+    )
+    assert response.status_code == 302
+
+
+@pytest.mark.parametrize(('proxies', 'limited'), ((0, True), (1, False)))
+def test_rate_limit_trust_proxy(app, proxies, limited):
+    app = create_app(dict(app.config, RATELIMIT_TRUST_PROXY=proxies, RATELIMIT_RULES={
+        'POST auth.login': ['1/minute per ip'],
+    }))
+    client = app.test_client()
+    data = {'username': 'a', 'password': 'b'}
+    # Requests of two clients come through the same proxy
+    for client_ip, status in (('1.2.3.4', 200), ('5.6.7.8', 429 if limited else 200)):
+        response = client.post(
+            '/auth/login',
+            data=data,
+            headers={'X-Forwarded-For': client_ip},
+            environ_base={'REMOTE_ADDR': '10.0.0.1'},
+        )
+        assert response.status_code == status
+
+
+def test_rate_limit_disabled(app):
+    app = create_app(dict(app.config, RATELIMIT_ENABLED=False, RATELIMIT_RULES={
+        'POST auth.login': ['1/minute per ip'],
+    }))
+    client = app.test_client()
+    for _ in range(3):
+        assert client.post('/auth/login', data={'username': 'a', 'password': 'b'})\
+            .status_code == 200
+
+
+def test_rate_limit_sqlite_storage(app):
+    db_fd, db_path = tempfile.mkstemp()
+    config = dict(
+        app.config,
+        RATELIMIT_STORAGE='sqlite',
+        RATELIMIT_SQLITE_PATH=db_path,
+        RATELIMIT_RULES={'POST auth.login': ['1/minute per username_ip']},
+    )
+    # Two apps stand for two worker processes sharing the file
+    clients = [create_app(config).test_client() for _ in range(2)]
+    data = {'username': 'a', 'password': 'b'}
+    assert clients[0].post('/auth/login', data=data).status_code == 200
+    assert clients[1].post('/auth/login', data=data).status_code == 429
+    os.close(db_fd)
+    os.unlink(db_path)
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import pytest
+
+from flaskr import create_app
+from flaskr.db import db
+from flaskr.models import Post, User
+
+from conftest import db_insert_test_data
+
+REPLICAS = 2
+
+
+@pytest.fixture
+def replica_config():
+    files = [tempfile.mkstemp() for _ in range(REPLICAS + 1)]
+    primary, replicas = files[0], files[1:]
+    writers_dir = tempfile.mkdtemp()
+    yield {
+        'SECRET_KEY': 'test',
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + primary[1],
+        'REPLICA_DATABASE_URIS': ['sqlite:///' + path for _, path in replicas],
+        'REPLICA_WRITERS_DIR': writers_dir,
+    }
+    for db_fd, db_path in files:
+        os.close(db_fd)
+        os.unlink(db_path)
+    shutil.rmtree(writers_dir)
+
+
+@pytest.fixture
+def replica_app(replica_config):
+    app = create_app(replica_config)
+    db_insert_test_data(app)
+    with app.app_context():
+        # Every replica has a copy of the test user and a post of its own
+        for index in range(REPLICAS):
+            engine = db.get_engine(app, bind='replica_{}'.format(index))
+            db.Model.metadata.create_all(bind=engine)
+            engine.execute(User.__table__.insert(), {
+                'id_': 1,
+                'username': 'test',
+                'password_hash': 'hash',
+                'post_count': 1,
+            })
+            engine.execute(Post.__table__.insert(), {
+                'author_id': 1,
+                'created': datetime(2020, 1, 1),
+                'title': 'replica {}'.format(index),
+                'body': '',
+            })
+
+    return app
+
+
+def _titles(response):
+    return [post['title'] for post in response.get_json()['posts']]
+
+
+def test_reads_go_to_replicas_round_robin(replica_app, auth_client):
+    client, headers = auth_client
+    titles = [_titles(client.get('/api/posts', headers=headers)) for _ in range(4)]
+    assert titles == [['replica 0'], ['replica 1'], ['replica 0'], ['replica 1']]
+
+
+def test_token_verification_uses_primary(replica_app, auth_client):
+    # Replicas don't know the token, the request would fail if they were asked
+    client, headers = auth_client
+    assert client.get('/api/users/1', headers=headers).status_code == 200
+
+
+def test_writes_go_to_primary_and_stick(replica_app, auth_client):
+    client, headers = auth_client
+    response = client.post(
+        '/api/posts/batch',
+        json={'posts': [{'title': 'new'}]},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    # The writer reads from the primary until the sticky window passes
+    assert _titles(client.get('/api/posts', headers=headers))[0] == 'new'
+    replica_app.extensions['replicas'].recent_writers.clear()
+    assert _titles(client.get('/api/posts', headers=headers)) == ['replica 0']
+
+
+def test_api_writer_sticks_in_other_workers(replica_app, replica_config, auth_client):
+    client, headers = auth_client
+    client.post('/api/posts/batch', json={'posts': [{'title': 'new'}]}, headers=headers)
+    # Another worker process of the host shares the writers directory
+    other_client = create_app(replica_config).test_client()
+    assert _titles(other_client.get('/api/posts', headers=headers))[0] == 'new'
+
+
+def test_browser_writer_sticks_in_other_workers(replica_app, replica_config):
+    client = replica_app.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    assert b'replica' in client.get('/').data
+    response = client.post('/create', data={'title': 'new', 'body': ''})
+    cookie = response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+    # The time of the write travels in the session cookie to another worker
+    other_client = create_app(replica_config).test_client()
+    other_client.set_cookie('localhost', 'session', cookie)
+    data = other_client.get('/').data
+    assert b'new' in data
+    assert b'replica' not in data
+
+
+def test_blog_index_fills_cache_from_primary(replica_app):
+    client = replica_app.test_client()
+    assert b'test title' in client.get('/').data
+    assert b'replica' not in client.get('/').data
+
+
+def test_no_replicas(app, client, auth):
+    assert app.extensions['replicas'].next_bind_key() is None
+    response = client.get('/api/posts', headers=auth.api_login())
+    assert _titles(response) == ['other title', 'test title']
+
+
+@pytest.fixture
+def auth_client(replica_app):
+    client = replica_app.test_client()
+    credentials = client.post('/api/tokens', headers={
+        'Authorization': 'Basic dGVzdDp0ZXN0',
+    }).get_json()
+    # Getting a token is a write, don't let it pin the user to the primary
+    replica_app.extensions['replicas'].recent_writers.clear()
+    return client, {'Authorization': 'Bearer {}'.format(credentials['token'])}
@@ -0,0 +1,107 @@
+import pytest
+
+from flaskr.db import get_db
+from flaskr.models import Post
+from flaskr.search import like_search_ids
+
+
+def test_search_api(client, auth):
+    response = client.get('/api/search?q=other', headers=auth.api_login())
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert [post['id'] for post in json_data['posts']] == [2]
+    assert json_data['posts'][0]['author']['username'] == 'other'
+    assert json_data['_links']['next'] is None
+
+
+def test_search_api_ranks_title_matches_first(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.session.add_all((
+            Post(author_id=1, title='unrelated', body='apple'),
+            Post(author_id=1, title='apple', body='banana'),
+        ))
+        db.session.commit()
+    json_data = client.get('/api/search?q=apple', headers=auth.api_login()).get_json()
+    assert [post['title'] for post in json_data['posts']] == ['apple', 'unrelated']
+
+
+def test_search_api_pagination(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.session.add_all(
+            Post(author_id=1, title='page {}'.format(i), body='paginated')
+            for i in range(5)
+        )
+        db.session.commit()
+    headers = auth.api_login()
+    first = client.get('/api/search?q=paginated&limit=3', headers=headers).get_json()
+    assert first['count'] == 3
+    second = client.get(first['_links']['next'], headers=headers).get_json()
+    assert second['count'] == 2
+    assert second['_links']['next'] is None
+    ids = [post['id'] for post in first['posts'] + second['posts']]
+    assert len(set(ids)) == 5
+
+
+@pytest.mark.parametrize('q', ('', '   '))
+def test_search_api_requires_query(client, auth, q):
+    response = client.get('/api/search?q={}'.format(q), headers=auth.api_login())
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('q', ('"', 'title AND', 'NEAR(', 'body*', "o'rly -x"))
+def test_search_api_special_characters(client, auth, q):
+    response = client.get('/api/search', query_string={'q': q}, headers=auth.api_login())
+    assert response.status_code == 200
+
+
+def test_search_index_follows_writes(client, auth):
+    auth.login()
+    client.post('/create', data={'title': 'fresh', 'body': 'kiwi'})
+    client.post('/1/update', data={'title': 'renamed', 'body': 'mango'})
+
+    response = client.get('/search?q=kiwi')
+    assert b'fresh' in response.data
+    response = client.get('/search?q=test')
+    assert b'test title' not in response.data
+    response = client.get('/search?q=mango')
+    assert b'renamed' in response.data
+
+    client.post('/1/delete')
+    response = client.get('/search?q=mango')
+    assert b'Nothing found' in response.data
+
+
+def test_search_page(client):
+    response = client.get('/')
+    assert b'action="/search"' in response.data
+    response = client.get('/search?q=test')
+    assert response.status_code == 200
+    assert b'test title' in response.data
+    assert b'other title' not in response.data
+
+
+def test_like_search(app):
+    with app.app_context():
+        db = get_db()
+        db.session.add_all((
+            Post(author_id=1, title='unrelated', body='Apple pie'),
+            Post(author_id=1, title='apple pie', body='banana'),
+            Post(author_id=1, title='100% apple', body=''),
+            Post(author_id=1, title='apple', body='cake'),
+        ))
+        db.session.commit()
+        assert like_search_ids('APPLE pie', 10, 0) == [4, 3]
+        assert like_search_ids('100%', 10, 0) == [5]
+        assert like_search_ids('1_0', 10, 0) == []
+        assert like_search_ids('apple', 2, 1) == [5, 4]
+
+
+def test_search_falls_back_to_like(app, client, auth, monkeypatch):
+    headers = auth.api_login()
+    with app.app_context():
+        monkeypatch.setattr(get_db().engine.dialect, 'name', 'postgresql')
+    response = client.get('/api/search?q=other', headers=headers)
+    assert [post['id'] for post in response.get_json()['posts']] == [2]
+    assert b'other title' in client.get('/search?q=other').data
@@ -0,0 +1,69 @@
+import base64
+
+from flaskr.security import PasswordHasher
+
+TEST_HASH = (
+    'pbkdf2:sha256:50000$TCI4GzcX$'
+    '0de171a4f4dac32e3364c7ddc7c14f3e2fa61f2d17574483f7ffbb431b4acb2f'
+)
+
+
+def count_kdf_calls(monkeypatch):
+    calls = []
+
+    def fake_check(password_hash, password):
+        calls.append(password)
+        return password == 'test'
+
+    monkeypatch.setattr('flaskr.security.check_password_hash', fake_check)
+    return calls
+
+
+def test_check_caches_successful_verification(monkeypatch):
+    calls = count_kdf_calls(monkeypatch)
+    hasher = PasswordHasher(max_concurrency=1, timeout=1, cache_size=10, cache_ttl=60)
+    assert hasher.check(TEST_HASH, 'test')
+    assert hasher.check(TEST_HASH, 'test')
+    assert len(calls) == 1
+
+
+def test_check_doesnt_cache_failures(monkeypatch):
+    calls = count_kdf_calls(monkeypatch)
+    hasher = PasswordHasher(max_concurrency=1, timeout=1, cache_size=10, cache_ttl=60)
+    assert not hasher.check(TEST_HASH, 'wrong')
+    assert not hasher.check(TEST_HASH, 'wrong')
+    assert len(calls) == 2
+
+
+def test_check_cache_is_bound_to_hash(monkeypatch):
+    calls = count_kdf_calls(monkeypatch)
+    hasher = PasswordHasher(max_concurrency=1, timeout=1, cache_size=10, cache_ttl=60)
+    assert hasher.check(TEST_HASH, 'test')
+    assert hasher.check(TEST_HASH + 'changed', 'test')
+    assert len(calls) == 2
+
+
+def test_hashing_busy(app, client):
+    app.extensions['password_hasher'] = PasswordHasher(
+        max_concurrency=1,
+        timeout=0,
+        cache_size=0,
+        cache_ttl=0,
+    )
+    app.extensions['password_hasher']._slots.acquire()
+
+    credentials = base64.b64encode(b'test:test').decode('utf-8')
+    response = client.post(
+        '/api/tokens',
+        headers={'Authorization': 'Basic {}'.format(credentials)},
+    )
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+    response = client.post(
+        '/auth/login',
+        data={'username': 'test', 'password': 'test'},
+        headers={'Accept': 'text/html'},
+    )
+    assert response.status_code == 503
+    assert b'The server is busy' in response.data
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from flaskr.db import get_db
+from flaskr.models import Post, User
+from flaskr.serializers import (
+    POST_FIELDS,
+    USER_FIELDS,
+    RowSerializer,
+    get_backend,
+    post_rows,
+    user_rows,
+)
+
+BACKENDS = ('json', 'orjson')
+
+
+def backend_or_skip(name):
+    try:
+        return get_backend(name)
+    except ValueError:
+        pytest.skip('{} is not installed'.format(name))
+
+
+@pytest.mark.parametrize('backend_name', BACKENDS)
+def test_post_serializer_matches_to_dict(app, backend_name):
+    serializer = RowSerializer(POST_FIELDS, backend_or_skip(backend_name))
+    with app.app_context():
+        db = get_db()
+        db.session.add(Post(
+            author_id=1,
+            title='quotes " and \\ slashes',
+            body='unicode привет \U0001f600\nand %s',
+        ))
+        db.session.commit()
+        posts = {post.id_: post.to_dict() for post in Post.query.all()}
+        rows = post_rows().all()
+        assert len(rows) == len(posts)
+        for row in rows:
+            assert json.loads(serializer(row)) == posts[row.id_]
+
+
+@pytest.mark.parametrize('backend_name', BACKENDS)
+def test_user_serializer_matches_to_dict(app, backend_name):
+    serializer = RowSerializer(USER_FIELDS, backend_or_skip(backend_name))
+    with app.app_context():
+        users = {user.id_: user.to_dict() for user in User.query.all()}
+        for row in user_rows():
+            assert json.loads(serializer(row)) == users[row.id_]
+
+
+def test_serializer_keys():
+    serializer = RowSerializer(POST_FIELDS, get_backend('json'))
+    assert serializer.keys == [
+        'id', 'author_id', 'author.username', 'author.first_name',
+        'author.last_name', 'created', 'title', 'body',
+    ]
+    assert len(serializer.keys) == len(serializer.columns)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend('pickle')
+
+
+@pytest.mark.parametrize('backend_name', BACKENDS)
+def test_collection_endpoints_with_backend(app, client, auth, backend_name):
+    backend_or_skip(backend_name)
+    app.config['JSON_ENCODER'] = backend_name
+    from flaskr import serializers
+    serializers.init_app(app)
+    headers = auth.api_login()
+    json_data = client.get('/api/posts?limit=1', headers=headers).get_json()
+    assert json_data['count'] == 1
+    assert json_data['_meta']['next_cursor'] is not None
+    with app.app_context():
+        assert json_data['posts'] == [Post.query.get(2).to_dict()]